@@ -1,70 +1,334 @@
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import AssemblyCache
 import Code
+import contextlib
+import glob
+import io
+import os
 import Parser
+import SymbolMap
 import SymbolTable
 import sys
+import time
+
+VERSION = '1.1'
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
 
 
 class Assembler:
-    def __init__(self):
+    def __init__(self, cache=None):
         self._parser = Parser.Parser()
         self._code = Code.Code()
+        self._cache = cache
+        self._reset()
+
+    def _reset(self):
         self._symbol_table = SymbolTable.SymbolTable()
         self._symbol_address = 16
+        self._line_numbers = array('I')
+
+    def assemble(self, input_file, single_pass=False, binary=False,
+                 symbols=False):
+        self._reset()
+        output_file = self._createOutfile(input_file)
+        if self._cache is None:
+            with open(input_file) as f:
+                rom = self._parse(f, single_pass)
+        else:
+            rom = self._parseWithCache(input_file, single_pass)
+
+        self._writeHack(rom, output_file)
+        if binary:
+            self._writeBinary(rom, self._createOutfile(input_file, '.bin'))
+        if symbols:
+            self.getSymbolMap().write(self._createOutfile(input_file, '.sym'))
+            SymbolMap.writeSourceMap(self._line_numbers,
+                                     self._createOutfile(input_file, '.map'))
+        return rom
+
+    def getSymbolMap(self):
+        return SymbolMap.SymbolMap(self._symbol_table.getLabels(),
+                                   self._symbol_table.getVariables())
+
+    def getLineNumbers(self):
+        return self._line_numbers
+
+    def assembleLines(self, lines):
+        """アセンブリの行を順に受け取り，16bitの機械語を順に返す．
+        ファイルを介さずに，VMTranslatorの出力などをそのまま渡すことができる．
+        前方参照や変数を含む命令より後ろは，それが解決するまで返されない．
+
+        Args:
+            lines (iterable): アセンブリの行
+
+        Yields:
+            int: 機械語
+        """
+        self._reset()
+        yield from self._streamParse(self._parser.parse(lines))
+
+    def _parse(self, lines, single_pass):
+        if single_pass:
+            return self._singleParse(self._parser.parse(lines))
+        instructions = list(self._parser.parse(lines))
+        self._firstParse(instructions)
+        return self._secondParse(instructions)
 
-    def assemble(self, input_file):
-        self._firstParse(input_file)
-        self._secondParse(input_file, self._createOutfile(input_file))
+    def _parseWithCache(self, input_file, single_pass):
+        with open(input_file, 'rb') as f:
+            source = f.read()
+        key = self._cache.key(source)
+        cached = self._cache.get(key)
+        if cached is not None:
+            rom, (labels, variables, line_numbers) = cached
+            for symbol, address in labels.items():
+                self._symbol_table.addLabel(symbol, address)
+            for symbol, address in variables.items():
+                self._symbol_table.addVariable(symbol, address)
+            self._line_numbers.frombytes(line_numbers)
+            return rom
 
-    def _createOutfile(self, input_file):
+        rom = self._parse(source.decode().splitlines(), single_pass)
+        self._cache.put(key, rom, (self._symbol_table.getLabels(),
+                                   self._symbol_table.getVariables(),
+                                   self._line_numbers.tobytes()))
+        return rom
+
+    def _createOutfile(self, input_file, extension='.hack'):
         if input_file.endswith('.asm'):
-            return input_file.replace('.asm', '_generated.hack')
+            return input_file[:-len('.asm')] + '_generated' + extension
         else:
             print("Unexpected file.")
             sys.exit(1)
 
-    def _firstParse(self, file):
-        with open(file) as f:
-            current_address = 0
-            for line in f:
-                command_type = self._parser.commandType(line)
-                if command_type == self._parser.A_COMMAND \
-                        or command_type == self._parser.C_COMMAND:
-                    current_address += 1
-                elif command_type == self._parser.L_COMMAND:
-                    symbol = self._parser.symbol(line)
-                    self._symbol_table.addEntry(symbol, current_address)
-
-    def _secondParse(self, input_file, output_file):
-        with open(input_file) as f:
-            with open(output_file, 'w') as out:
-                for line in f:
-                    command_type = self._parser.commandType(line)
-                    if command_type == self._parser.A_COMMAND:
-                        symbol = self._parser.symbol(line)
-                        address = self._getAddress(symbol)
-                        binary = self._code.convertTypeA(address)
-                        out.write(binary + '\n')
-                    elif command_type == self._parser.C_COMMAND:
-                        comp = self._parser.comp(line)
-                        dest = self._parser.dest(line)
-                        jump = self._parser.jump(line)
-                        binary = self._code.convertTypeC(comp, dest, jump)
-                        out.write(binary + '\n')
-                    elif command_type == self._parser.L_COMMAND:
-                        continue
+    def _firstParse(self, instructions):
+        current_address = 0
+        for instruction in instructions:
+            if instruction.kind == self._parser.L_COMMAND:
+                self._symbol_table.addLabel(instruction.symbol,
+                                            current_address)
+            else:
+                current_address += 1
+
+    def _secondParse(self, instructions):
+        rom = array('H')
+        for instruction in instructions:
+            if instruction.kind == self._parser.A_COMMAND:
+                address = self._getAddress(instruction.symbol)
+                rom.append(self._encodeTypeA(address,
+                                             instruction.line_number))
+                self._line_numbers.append(instruction.line_number)
+            elif instruction.kind == self._parser.C_COMMAND:
+                rom.append(self._encodeTypeC(instruction))
+                self._line_numbers.append(instruction.line_number)
+        return rom
+
+    def _singleParse(self, instructions):
+        return array('H', self._streamParse(instructions))
+
+    def _streamParse(self, instructions):
+        # 前方参照のラベルは仮置きしておき，定義された時点で埋める．
+        # 先頭から未解決の命令がなくなった分だけ順に返していく
+        pending = deque()
+        base = 0
+        fixups = {}
+        for instruction in instructions:
+            if instruction.kind == self._parser.A_COMMAND:
+                symbol = instruction.symbol
+                if symbol.isdigit() or self._symbol_table.contains(symbol):
+                    address = self._getAddress(symbol)
+                    pending.append(self._encodeTypeA(
+                        address, instruction.line_number))
+                else:
+                    fixups.setdefault(symbol, []).append(base + len(pending))
+                    pending.append(None)
+                self._line_numbers.append(instruction.line_number)
+            elif instruction.kind == self._parser.C_COMMAND:
+                pending.append(self._encodeTypeC(instruction))
+                self._line_numbers.append(instruction.line_number)
+            elif instruction.kind == self._parser.L_COMMAND:
+                address = base + len(pending)
+                self._symbol_table.addLabel(instruction.symbol, address)
+                for index in fixups.pop(instruction.symbol, ()):
+                    pending[index - base] = self._encodeTypeA(
+                        address, self._line_numbers[index])
+
+            while pending and pending[0] is not None:
+                yield pending.popleft()
+                base += 1
+
+        # ラベルとして定義されなかったシンボルは，最初に参照された順に変数として割り当てる
+        for symbol, indexes in fixups.items():
+            address = self._getAddress(symbol)
+            for index in indexes:
+                pending[index - base] = self._encodeTypeA(
+                    address, self._line_numbers[index])
+        yield from pending
+
+    def _writeHack(self, rom, output_file):
+        with open(output_file, 'w') as out:
+            out.writelines(self._code.toBinaryString(word) + '\n'
+                           for word in rom)
+
+    def _writeBinary(self, rom, output_file):
+        # エミュレータから直接mmapできるよう，リトルエンディアンの16bit列で書き出す
+        if sys.byteorder != 'little':
+            rom = array('H', rom)
+            rom.byteswap()
+        with open(output_file, 'wb') as out:
+            rom.tofile(out)
+
+    def _encodeTypeA(self, address, line_number):
+        # 15bitに収まらない値をマスクすると，別のアドレスとして黙って通ってしまう
+        if not 0 <= int(address) <= 0x7fff:
+            print("Invalid address at line %d" % line_number)
+            sys.exit(1)
+        return self._code.encodeTypeA(address)
+
+    def _encodeTypeC(self, instruction):
+        try:
+            return self._code.encodeTypeC(
+                instruction.comp, instruction.dest, instruction.jump)
+        except KeyError:
+            print("Invalid instruction at line %d" % instruction.line_number)
+            sys.exit(1)
 
     def _getAddress(self, symbol):
         if symbol.isdigit():
             return symbol
         else:
             if not self._symbol_table.contains(symbol):
-                self._symbol_table.addEntry(symbol, self._symbol_address)
+                self._symbol_table.addVariable(symbol, self._symbol_address)
                 self._symbol_address += 1
             return self._symbol_table.getAddress(symbol)
 
 
-if len(sys.argv) != 2:
-    print("Invalid usage")
-    sys.exit(1)
-assembler = Assembler()
-assembler.assemble(sys.argv[1])
+def assembleFile(input_file, single_pass=False, binary=False,
+                 cache_dir=None, cache_size=None, symbols=False):
+    """1つの.asmファイルをアセンブルする．
+
+    Returns:
+        tuple: (所要時間（秒）, キャッシュにヒットしたか)．
+            キャッシュを使わない場合，後者はNone
+    """
+    start = time.perf_counter()
+    cache = None
+    if cache_dir is not None:
+        cache = AssemblyCache.AssemblyCache(
+            cache_dir, cache_size or DEFAULT_CACHE_SIZE, VERSION)
+    Assembler(cache).assemble(input_file, single_pass=single_pass,
+                              binary=binary, symbols=symbols)
+    hit = None if cache is None else cache.hits > 0
+    return time.perf_counter() - start, hit
+
+
+def assembleFiles(input_files, jobs=None, single_pass=False, binary=False,
+                  cache_dir=None, cache_size=None, symbols=False):
+    """複数の.asmファイルをプロセスプールで並列にアセンブルする．
+
+    Args:
+        input_files (list): .asmファイルのリスト
+        jobs (int): ワーカー数．Noneの場合はCPU数
+        single_pass (boolean): 1パスでアセンブルするか
+        binary (boolean): バイナリのROMファイルも書き出すか
+        cache_dir (string): キャッシュのディレクトリ．Noneの場合は使わない
+        cache_size (int): キャッシュの上限サイズ（バイト）
+        symbols (boolean): シンボルファイルとソースマップも書き出すか
+
+    Returns:
+        dict: ファイル名から (所要時間（秒）, キャッシュにヒットしたか,
+            エラーメッセージ) への辞書．成功した場合のエラーメッセージはNone
+    """
+    args = (single_pass, binary, cache_dir, cache_size, symbols)
+    if jobs == 1 or len(input_files) <= 1:
+        return {input_file: _tryAssembleFile(input_file, *args)
+                for input_file in input_files}
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_tryAssembleFile, input_file, *args)
+                   for input_file in input_files]
+        return {input_file: future.result()
+                for input_file, future in zip(input_files, futures)}
+
+
+def _tryAssembleFile(input_file, *args):
+    """1つの.asmファイルをアセンブルし，エラーは例外ではなく値として返す．
+
+    Returns:
+        tuple: (所要時間（秒）, キャッシュにヒットしたか,
+            エラーメッセージ．成功した場合はNone)
+    """
+    start = time.perf_counter()
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            seconds, hit = assembleFile(input_file, *args)
+    except SystemExit:
+        # Assemblerはエラーを表示して終了するので，表示された内容をメッセージにする
+        return (time.perf_counter() - start, None,
+                output.getvalue().strip() or 'failed')
+    except Exception as e:
+        return time.perf_counter() - start, None, str(e) or type(e).__name__
+    return seconds, hit, None
+
+
+def _getInputFiles(inputs):
+    input_files = []
+    for input in inputs:
+        if os.path.isdir(input):
+            input_files.extend(sorted(glob.glob(os.path.join(input, '*.asm'))))
+        else:
+            input_files.extend(sorted(glob.glob(input, recursive=True)))
+    if len(input_files) == 0:
+        print('No .asm files found')
+    return input_files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hack assembler')
+    parser.add_argument('inputs', nargs='+',
+                        help='.asm files, directories or glob patterns')
+    parser.add_argument('--single-pass', action='store_true',
+                        help='read each file once and backpatch labels')
+    parser.add_argument('--binary', action='store_true',
+                        help='also write a little-endian binary ROM image')
+    parser.add_argument('--symbols', action='store_true',
+                        help='also write a symbol file and a source map')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help='reuse results for unchanged sources from DIR')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help='cache size limit in bytes')
+    args = parser.parse_args(argv)
+
+    input_files = _getInputFiles(args.inputs)
+    start = time.perf_counter()
+    results = assembleFiles(input_files, jobs=args.jobs,
+                            single_pass=args.single_pass, binary=args.binary,
+                            cache_dir=args.cache, cache_size=args.cache_size,
+                            symbols=args.symbols)
+    elapsed = time.perf_counter() - start
+
+    failed = [input_file for input_file, (_, _, error) in results.items()
+              if error is not None]
+    if len(input_files) > 1:
+        for input_file, (seconds, _, error) in results.items():
+            print('%s: %s' % (input_file, '%.3fs' % seconds if error is None
+                              else 'failed: %s' % error))
+        print('%d files in %.3fs' % (len(input_files), elapsed))
+    elif failed:
+        print('%s: failed: %s' % (failed[0], results[failed[0]][2]))
+    if args.cache is not None:
+        hits = [hit for _, hit, error in results.values() if error is None]
+        print('cache: %d hits, %d misses' % (hits.count(True),
+                                             hits.count(False)))
+    if failed or not input_files:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
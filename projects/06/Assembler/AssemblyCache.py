@@ -0,0 +1,99 @@
+from array import array
+import hashlib
+import os
+import pickle
+import tempfile
+
+
+class AssemblyCache:
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024, version=''):
+        """アセンブル結果のキャッシュを開く．
+
+        Args:
+            directory (string): キャッシュを置くディレクトリ
+            max_size (int): キャッシュ全体の上限サイズ（バイト）
+            version (string): アセンブラのバージョン．変わると全てミスになる
+        """
+        self._directory = directory
+        self._max_size = max_size
+        self._version = version
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source):
+        """ソースの内容とアセンブラのバージョンからキーを作る．
+
+        Args:
+            source (bytes): .asmファイルの内容
+
+        Returns:
+            string: キャッシュのキー
+        """
+        digest = hashlib.sha256(self._version.encode())
+        digest.update(b'\0')
+        digest.update(source)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """キーに対応するROMイメージとシンボルを返す．
+
+        Args:
+            key (string): キャッシュのキー
+
+        Returns:
+            tuple: (array, dict)．存在しない場合はNone
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                words, symbols = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        rom = array('H')
+        rom.frombytes(words)
+        return rom, symbols
+
+    def put(self, key, rom, symbols):
+        """ROMイメージとシンボルを保存し，上限を超えた分を古い順に削除する．
+
+        Args:
+            key (string): キャッシュのキー
+            rom (array): ROMイメージ
+            symbols (dict): シンボルからアドレスへの辞書
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self._directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((rom.tobytes(), symbols), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path(key))
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + '.cache')
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self._directory):
+            if not entry.name.endswith('.cache'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -1,70 +1,93 @@
-class Code:
-    def __init__(self, *args, **kwargs):
-        self._comp_code = {
-            '0':   '0101010',
-            '1':   '0111111',
-            '-1':  '0111010',
-            'D':   '0001100',
-            'A':   '0110000',
-            '!D':  '0001101',
-            '!A':  '0110001',
-            '-D':  '0001111',
-            '-A':  '0110011',
-            'D+1': '0011111',
-            'A+1': '0110111',
-            'D-1': '0001110',
-            'A-1': '0110010',
-            'D+A': '0000010',
-            'D-A': '0010011',
-            'A-D': '0000111',
-            'D&A': '0000000',
-            'D|A': '0010101',
-            '':    'xxxxxxx',
-            'M':   '1110000',
-            '!M':  '1110001',
-            '-M':  '1110011',
-            'M+1': '1110111',
-            'M-1': '1110010',
-            'D+M': '1000010',
-            'D-M': '1010011',
-            'M-D': '1000111',
-            'D&M': '1000000',
-            'D|M': '1010101'
-        }
+_COMP_CODE = {
+    '0':   '0101010',
+    '1':   '0111111',
+    '-1':  '0111010',
+    'D':   '0001100',
+    'A':   '0110000',
+    '!D':  '0001101',
+    '!A':  '0110001',
+    '-D':  '0001111',
+    '-A':  '0110011',
+    'D+1': '0011111',
+    'A+1': '0110111',
+    'D-1': '0001110',
+    'A-1': '0110010',
+    'D+A': '0000010',
+    'D-A': '0010011',
+    'A-D': '0000111',
+    'D&A': '0000000',
+    'D|A': '0010101',
+    'M':   '1110000',
+    '!M':  '1110001',
+    '-M':  '1110011',
+    'M+1': '1110111',
+    'M-1': '1110010',
+    'D+M': '1000010',
+    'D-M': '1010011',
+    'M-D': '1000111',
+    'D&M': '1000000',
+    'D|M': '1010101'
+}
 
-        self._dest_code = {
-            '':     '000',
-            'M':    '001',
-            'D':    '010',
-            'MD':   '011',
-            'A':    '100',
-            'AM':   '101',
-            'AD':   '110',
-            'AMD':  '111'
-        }
+# 可換な演算はオペランドを入れ替えた表記も受け付ける
+_COMP_ALIASES = {
+    '1+D': 'D+1',
+    '1+A': 'A+1',
+    '1+M': 'M+1',
+    'A+D': 'D+A',
+    'A&D': 'D&A',
+    'A|D': 'D|A',
+    'M+D': 'D+M',
+    'M&D': 'D&M',
+    'M|D': 'D|M'
+}
 
-        self._jump_code = {
-            '':     '000',
-            'JGT':  '001',
-            'JEQ':  '010',
-            'JGE':  '011',
-            'JLT':  '100',
-            'JNE':  '101',
-            'JLE':  '110',
-            'JMP':  '111'
-        }
+_DEST_CODE = {
+    '':     '000',
+    'M':    '001',
+    'D':    '010',
+    'MD':   '011',
+    'A':    '100',
+    'AM':   '101',
+    'AD':   '110',
+    'AMD':  '111'
+}
 
-    def _comp(self, mnemonic):
-        return self._comp_code[mnemonic]
+_JUMP_CODE = {
+    '':     '000',
+    'JGT':  '001',
+    'JEQ':  '010',
+    'JGE':  '011',
+    'JLT':  '100',
+    'JNE':  '101',
+    'JLE':  '110',
+    'JMP':  '111'
+}
 
-    def _dest(self, mnemonic):
-        return self._dest_code[mnemonic]
+# (dest, comp, jump) の組から16bitの命令語を引く表．
+# 組み合わせは高々数千通りなので，全て事前に計算しておく
+_C_INSTRUCTIONS = {
+    (dest, comp, jump):
+        0xe000 | int(_COMP_CODE[_COMP_ALIASES.get(comp, comp)], 2) << 6
+        | int(dest_code, 2) << 3 | int(jump_code, 2)
+    for comp in list(_COMP_CODE) + list(_COMP_ALIASES)
+    for dest, dest_code in _DEST_CODE.items()
+    for jump, jump_code in _JUMP_CODE.items()
+}
 
-    def _jump(self, mnemonic):
-        return self._jump_code[mnemonic]
 
+class Code:
     def convertTypeA(self, address):
-        return '0' + bin(int(address))[2:].zfill(15)
+        return self.toBinaryString(self.encodeTypeA(address))
 
     def convertTypeC(self, comp, dest, jump):
-        return '111' + self._comp(comp) + self._dest(dest) + self._jump(jump)
+        return self.toBinaryString(self.encodeTypeC(comp, dest, jump))
+
+    def encodeTypeA(self, address):
+        return int(address)
+
+    def encodeTypeC(self, comp, dest, jump):
+        return _C_INSTRUCTIONS[(dest, comp, jump)]
+
+    def toBinaryString(self, word):
+        return format(word, '016b')
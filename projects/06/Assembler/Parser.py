@@ -1,3 +1,16 @@
+class Instruction:
+    __slots__ = ('kind', 'symbol', 'comp', 'dest', 'jump', 'line_number')
+
+    def __init__(self, kind, symbol='', comp='', dest='', jump='',
+                 line_number=0):
+        self.kind = kind
+        self.symbol = symbol
+        self.comp = comp
+        self.dest = dest
+        self.jump = jump
+        self.line_number = line_number
+
+
 class Parser:
     A_COMMAND = 'A'
     C_COMMAND = 'C'
@@ -10,43 +23,48 @@ class Parser:
         self._l_command_signature = '('
         self._comment_signature = '//'
 
-    def commandType(self, command):
+    def parse(self, lines):
+        for line_number, line in enumerate(lines, 1):
+            instruction = self.parseLine(line, line_number)
+            if instruction is not None:
+                yield instruction
+
+    def parseLine(self, command, line_number=0):
         _command = self._format(command)
         if _command.startswith(self._a_command_signature):
-            return Parser.A_COMMAND
-        if not _command.startswith(self._comment_signature) \
-                and (self._c_command_signature_semicologne in _command
-                     or self._c_command_signature_equal in _command):
-            return Parser.C_COMMAND
+            return Instruction(Parser.A_COMMAND, symbol=_command[1:],
+                               line_number=line_number)
+        if self._c_command_signature_semicologne in _command \
+                or self._c_command_signature_equal in _command:
+            _command = _command.split(' ')[0]
+            dest, equal, comp = _command.rpartition(
+                self._c_command_signature_equal)
+            comp, semicologne, jump = comp.partition(
+                self._c_command_signature_semicologne)
+            return Instruction(Parser.C_COMMAND, comp=comp, dest=dest,
+                               jump=jump, line_number=line_number)
         if _command.startswith(self._l_command_signature):
-            return Parser.L_COMMAND
+            return Instruction(Parser.L_COMMAND, symbol=_command[1:-1],
+                               line_number=line_number)
+
+    def commandType(self, command):
+        instruction = self.parseLine(command)
+        if instruction is not None:
+            return instruction.kind
 
     def symbol(self, command):
-        _command = self._format(command)
-        if self.commandType(command) == Parser.A_COMMAND:
-            return _command[1:]
-        if self.commandType(command) == Parser.C_COMMAND:
-            return _command[1]
-        if self.commandType(command) == Parser.L_COMMAND:
-            return _command[1:-1]
+        instruction = self.parseLine(command)
+        if instruction is not None:
+            return instruction.symbol
 
     def comp(self, command):
-        _command = self._format(command).split(' ')[0]
-        return _command.split(self._c_command_signature_equal)[1] \
-            if self._c_command_signature_equal in _command \
-            else _command.split(self._c_command_signature_semicologne)[0]
+        return self.parseLine(command).comp
 
     def dest(self, command):
-        _command = self._format(command).split(' ')[0]
-        return _command.split(self._c_command_signature_equal)[0] \
-            if self._c_command_signature_equal in _command \
-            else ''
+        return self.parseLine(command).dest
 
     def jump(self, command):
-        _command = self._format(command).split(' ')[0]
-        return _command.split(self._c_command_signature_semicologne)[1] \
-            if self._c_command_signature_semicologne in _command \
-            else ''
+        return self.parseLine(command).jump
 
     def _format(self, command):
         if command.startswith(self._comment_signature):
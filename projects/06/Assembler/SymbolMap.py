@@ -0,0 +1,117 @@
+from array import array
+from bisect import bisect_right
+
+
+class SymbolMap:
+    LABEL = 'L'
+    VARIABLE = 'V'
+
+    def __init__(self, labels, variables):
+        """ラベルと変数のアドレスを，アドレス順に並べて保持する．
+
+        Args:
+            labels (dict): ラベルからROMアドレスへの辞書
+            variables (dict): 変数からRAMアドレスへの辞書
+        """
+        self._labels = sorted((address, symbol)
+                              for symbol, address in labels.items())
+        self._variables = sorted((address, symbol)
+                                 for symbol, address in variables.items())
+        self._label_addresses = [address for address, _ in self._labels]
+        self._variable_addresses = [address
+                                    for address, _ in self._variables]
+        self._label_table = dict(labels)
+
+    @classmethod
+    def load(cls, path):
+        """write()で書き出したシンボルファイルを読み込む．
+
+        Args:
+            path (string): シンボルファイル
+
+        Returns:
+            SymbolMap: 読み込んだシンボル
+        """
+        labels = {}
+        variables = {}
+        with open(path) as f:
+            for line in f:
+                kind, address, symbol = line.split()
+                if kind == cls.LABEL:
+                    labels[symbol] = int(address)
+                else:
+                    variables[symbol] = int(address)
+        return cls(labels, variables)
+
+    def write(self, path):
+        """1行に「種類 アドレス シンボル」の形式で，アドレス順に書き出す．
+
+        Args:
+            path (string): シンボルファイル
+        """
+        with open(path, 'w') as f:
+            for address, symbol in self._labels:
+                f.write('%s %d %s\n' % (SymbolMap.LABEL, address, symbol))
+            for address, symbol in self._variables:
+                f.write('%s %d %s\n' % (SymbolMap.VARIABLE, address, symbol))
+
+    def labelAt(self, address):
+        """ROMアドレスを含むラベル（そのアドレス以前で最も近いラベル）を返す．
+
+        Args:
+            address (int): ROMアドレス
+
+        Returns:
+            string: ラベル．存在しない場合はNone
+        """
+        index = bisect_right(self._label_addresses, address) - 1
+        return self._labels[index][1] if index >= 0 else None
+
+    def getLabelAddress(self, symbol):
+        """ラベルのROMアドレスを返す．
+
+        Args:
+            symbol (string): ラベル
+
+        Returns:
+            int: ROMアドレス．存在しない場合はNone
+        """
+        return self._label_table.get(symbol)
+
+    def variableAt(self, address):
+        """RAMアドレスに割り当てられた変数を返す．
+
+        Args:
+            address (int): RAMアドレス
+
+        Returns:
+            string: 変数．存在しない場合はNone
+        """
+        index = bisect_right(self._variable_addresses, address) - 1
+        if index >= 0 and self._variables[index][0] == address:
+            return self._variables[index][1]
+        return None
+
+
+def writeSourceMap(line_numbers, path):
+    """ROMアドレスごとに対応する.asmの行番号を1行ずつ書き出す．
+
+    Args:
+        line_numbers (array): ROMアドレス順の行番号
+        path (string): ソースマップのファイル
+    """
+    with open(path, 'w') as f:
+        f.writelines('%d\n' % line_number for line_number in line_numbers)
+
+
+def loadSourceMap(path):
+    """writeSourceMap()で書き出したファイルを読み込む．
+
+    Args:
+        path (string): ソースマップのファイル
+
+    Returns:
+        array: ROMアドレスをインデックスとする行番号の配列
+    """
+    with open(path) as f:
+        return array('I', (int(line) for line in f))
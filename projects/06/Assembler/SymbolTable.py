@@ -25,12 +25,28 @@ class SymbolTable:
             'SCREEN': 16384,
             'KBD':    24576
         }
+        self._labels = {}
+        self._variables = {}
 
     def addEntry(self, symbol, address):
         self._symbols[symbol] = address
 
+    def addLabel(self, symbol, address):
+        self._labels[symbol] = address
+        self.addEntry(symbol, address)
+
+    def addVariable(self, symbol, address):
+        self._variables[symbol] = address
+        self.addEntry(symbol, address)
+
     def contains(self, symbol):
         return symbol in self._symbols
 
     def getAddress(self, symbol):
         return self._symbols[symbol]
+
+    def getLabels(self):
+        return dict(self._labels)
+
+    def getVariables(self):
+        return dict(self._variables)
@@ -1,4 +1,3 @@
-from collections import deque
 from enums import Enums
 import sys
 
@@ -6,44 +5,39 @@ import sys
 class Parser:
 
     def __init__(self, input_file):
-        """入力ファイルを開き，パースを行う準備をする
+        """入力ファイルを開き，パースを行う準備をする．
+        ファイルは1行ずつ読み進めるので，ファイル全体をメモリに持たない．
 
         Args:
             input_file (string): 入力ファイル名
         """
-        _input_file = open(input_file, 'r')
-        self.lines = deque(
-            [line.split("//")[0].rstrip()
-             for line in _input_file.readlines()
-             if line.split("//")[0].rstrip()])
-        _input_file.close()
-
+        self.input_file = input_file
+        self.line_number = 0
         self.current_command = ('', '', '')
 
+        self._lines = self._readLines()
+        self._next = next(self._lines, None)
+
     def hasMoreCommands(self):
         """入力ファイルにさらにコマンドが存在するか？
 
         Returns:
             boolean: コマンドの存在有無
         """
-        return True if len(self.lines) else False
+        return self._next is not None
 
     def advance(self):
         """入力から次のコマンドを読み，それを現コマンドとする．hasMoreCommandsがtrueのときのみ本ルーチンを呼ぶようにする．最初は現コマンドは空である．
         """
-        operation = self.lines.popleft().split(' ')
-        if len(operation) == 1:
-            self.current_command = (operation[0], '', '')
-            return
-        elif len(operation) == 2:
-            self.current_command = (operation[0], operation[1], '')
-            return
-        elif len(operation) == 3:
-            self.current_command = (operation[0], operation[1], operation[2])
-            return
-
-        print("Invalid .vm format at Parser.advance()")
-        sys.exit(1)
+        self.line_number, operation = self._next
+        self._next = next(self._lines, None)
+
+        command = _COMMAND_TYPES.get(operation[0])
+        if command is None or len(operation) != _ARGUMENT_COUNTS[command]:
+            self._error(operation)
+        if len(operation) == 3 and not operation[2].isdigit():
+            self._error(operation)
+        self.current_command = tuple(operation + [''] * (3 - len(operation)))
 
     def commandType(self):
         """現VMコマンドの種類を返す．算術コマンドは全てC_ARITHMETICが返される．
@@ -51,28 +45,7 @@ class Parser:
         Returns:
             Command: コマンドの種類
         """
-        if self.current_command[0] in \
-                ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']:
-            return Enums.Command.C_ARITHMETIC
-        if self.current_command[0] == 'push':
-            return Enums.Command.C_PUSH
-        if self.current_command[0] == 'pop':
-            return Enums.Command.C_POP
-        if self.current_command[0] == 'label':
-            return Enums.Command.C_LABEL
-        if self.current_command[0] == 'goto':
-            return Enums.Command.C_GOTO
-        if self.current_command[0] == 'if-goto':
-            return Enums.Command.C_IF
-        if self.current_command[0] == 'function':
-            return Enums.Command.C_FUNCTION
-        if self.current_command[0] == 'return':
-            return Enums.Command.C_RETURN
-        if self.current_command[0] == 'call':
-            return Enums.Command.C_CALL
-
-        print("Invalid .vm format at Parser.commandType()")
-        sys.exit(1)
+        return _COMMAND_TYPES[self.current_command[0]]
 
     def arg1(self):
         """現コマンドの最初の引数が返される．C_ARITHMETICの場合，コマンド自体が返される．現コマンドがC_RETURNの場合，本ルーチンは呼ばないようにする．
@@ -91,3 +64,47 @@ class Parser:
             int: 現コマンドの第2引数
         """
         return self.current_command[2]
+
+    def _readLines(self):
+        """コメントと空行を除いた各行を，行番号とともに1行ずつ読み出す．
+
+        Yields:
+            tuple: (行番号, 空白で区切った語のリスト)
+        """
+        with open(self.input_file, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                operation = line.split('//', 1)[0].split()
+                if operation:
+                    yield line_number, operation
+
+    def _error(self, operation):
+        print('Invalid .vm command "%s" at %s:%d' % (
+            ' '.join(operation).rstrip(), self.input_file, self.line_number))
+        sys.exit(1)
+
+
+# コマンド名からコマンドの種類への表
+_COMMAND_TYPES = dict(
+    [(name, Enums.Command.C_ARITHMETIC)
+     for name in ('add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not')] +
+    [('push', Enums.Command.C_PUSH),
+     ('pop', Enums.Command.C_POP),
+     ('label', Enums.Command.C_LABEL),
+     ('goto', Enums.Command.C_GOTO),
+     ('if-goto', Enums.Command.C_IF),
+     ('function', Enums.Command.C_FUNCTION),
+     ('return', Enums.Command.C_RETURN),
+     ('call', Enums.Command.C_CALL)])
+
+# コマンドの種類ごとの，コマンド名を含めた語数
+_ARGUMENT_COUNTS = {
+    Enums.Command.C_ARITHMETIC: 1,
+    Enums.Command.C_PUSH: 3,
+    Enums.Command.C_POP: 3,
+    Enums.Command.C_LABEL: 2,
+    Enums.Command.C_GOTO: 2,
+    Enums.Command.C_IF: 2,
+    Enums.Command.C_FUNCTION: 3,
+    Enums.Command.C_RETURN: 1,
+    Enums.Command.C_CALL: 3
+}
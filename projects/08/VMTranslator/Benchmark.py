@@ -0,0 +1,86 @@
+import argparse
+import CPUEmulator
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+COMPILER = os.path.join(PROJECTS, '11', 'Compiler', 'JackAnalyzer.py')
+TRANSLATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'VMTranslator.py')
+sys.path.append(os.path.join(PROJECTS, '06', 'Assembler'))
+import SymbolMap  # noqa: E402
+
+# Sys.haltで停止するプログラム
+DEFAULT_PROGRAMS = ['Seven', 'ConvertToBin', 'ComplexArrays']
+
+
+def benchmark(program, configs, max_cycles):
+    """projects/11のプログラムをコンパイルし，設定ごとに変換してROMサイズと実行命令数を測る．
+
+    Args:
+        program (string): projects/11以下のプログラム名
+        configs (list): VMTranslatorに渡すオプションの文字列のリスト
+        max_cycles (int): 実行する命令数の上限
+
+    Returns:
+        list: 設定ごとの (ROMサイズ, 実行命令数, Sys.haltに達したか)．
+            ROMに収まらない場合，実行命令数はNone
+    """
+    work = tempfile.mkdtemp()
+    try:
+        for path in glob.glob(os.path.join(PROJECTS, '11', program, '*')):
+            if path.endswith(('.jack', '.vm')):
+                shutil.copy(path, work)
+        subprocess.run([sys.executable, COMPILER, work], check=True,
+                       stdout=subprocess.DEVNULL)
+
+        results = []
+        for config in configs:
+            asm_file = os.path.join(work, 'out.asm')
+            subprocess.run([sys.executable, TRANSLATOR, work, asm_file] +
+                           config.split(), check=True,
+                           stdout=subprocess.DEVNULL)
+            rom = CPUEmulator.assemble(asm_file, symbols=True)
+            if len(rom) > CPUEmulator.ROM_SIZE:
+                results.append((len(rom), None, False))
+                continue
+
+            symbol_map = SymbolMap.SymbolMap.load(
+                asm_file[:-len('.asm')] + '_generated.sym')
+            halt = symbol_map.getLabelAddress('Sys.halt')
+            cpu = CPUEmulator.CPUEmulator(rom)
+            cpu.run(max_cycles, stop=halt)
+            results.append((len(rom), cpu.cycles, cpu.pc == halt))
+        return results
+    finally:
+        shutil.rmtree(work)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare VMTranslator options on the projects/11 programs')
+    parser.add_argument('configs', nargs='+',
+                        help='VMTranslator options, one quoted string each')
+    parser.add_argument('--programs', nargs='+', default=DEFAULT_PROGRAMS)
+    parser.add_argument('--cycles', type=int, default=50000000,
+                        help='maximum number of instructions to execute')
+    args = parser.parse_args(argv)
+
+    print('%-14s %-40s %8s %12s' % ('program', 'options', 'ROM', 'cycles'))
+    for program in args.programs:
+        results = benchmark(program, args.configs, args.cycles)
+        for config, (rom_size, cycles, halted) in zip(args.configs, results):
+            if cycles is None:
+                status = 'overflow'
+            else:
+                status = '%d%s' % (cycles, '' if halted else '+')
+            print('%-14s %-40s %8d %12s' % (program, config or '(default)',
+                                            rom_size, status))
+
+
+if __name__ == '__main__':
+    main()
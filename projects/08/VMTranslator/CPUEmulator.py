@@ -0,0 +1,173 @@
+import os
+import re
+import subprocess
+import sys
+
+ASSEMBLER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', '06', 'Assembler', 'Assembler.py')
+ROM_SIZE = 32768
+
+# comp（a以外の6bit）からALUの計算への表．xはD，yはAまたはM
+_ALU = {
+    0b101010: lambda x, y: 0,
+    0b111111: lambda x, y: 1,
+    0b111010: lambda x, y: -1,
+    0b001100: lambda x, y: x,
+    0b110000: lambda x, y: y,
+    0b001101: lambda x, y: ~x,
+    0b110001: lambda x, y: ~y,
+    0b001111: lambda x, y: -x,
+    0b110011: lambda x, y: -y,
+    0b011111: lambda x, y: x + 1,
+    0b110111: lambda x, y: y + 1,
+    0b001110: lambda x, y: x - 1,
+    0b110010: lambda x, y: y - 1,
+    0b000010: lambda x, y: x + y,
+    0b010011: lambda x, y: x - y,
+    0b000111: lambda x, y: y - x,
+    0b000000: lambda x, y: x & y,
+    0b010101: lambda x, y: x | y,
+}
+
+
+class CPUEmulator:
+
+    def __init__(self, rom):
+        """ROMイメージを読み込み，Hack CPUを初期化する．
+
+        Args:
+            rom (list): 16bitの機械語のリスト
+        """
+        self.rom = list(rom)
+        self.ram = [0] * 32768
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self._program = [self._decode(word) for word in self.rom]
+
+    def _decode(self, word):
+        if word < 0x8000:
+            return (None, word, 0, 0)
+        comp = _ALU[(word >> 6) & 0x3f]
+        return (comp, word & 0x1000, (word >> 3) & 7, word & 7)
+
+    def run(self, cycles, stop=None):
+        """最大cycles命令を実行する．PCがstopに達するか，ROMの外に出た場合は止まる．
+
+        Args:
+            cycles (int): 実行する命令数の上限
+            stop (int): 停止するROMアドレス
+
+        Returns:
+            int: 実行した命令数
+        """
+        ram = self.ram
+        program = self._program
+        size = len(program)
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while executed < cycles and pc < size and pc != stop:
+            executed += 1
+            comp, y_m, dest, jump = program[pc]
+            if comp is None:
+                a = y_m
+                pc += 1
+                continue
+            out = comp(d, ram[a] if y_m else a) & 0xffff
+            if dest & 1:
+                ram[a] = out
+            pc += 1
+            if jump:
+                signed = out - 0x10000 if out & 0x8000 else out
+                if (jump & 4 and signed < 0) or (jump & 2 and signed == 0) \
+                        or (jump & 1 and signed > 0):
+                    pc = a
+            if dest & 2:
+                d = out
+            if dest & 4:
+                a = out
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        return executed
+
+
+def loadHack(path):
+    """.hackファイルを読み込む．
+
+    Args:
+        path (string): .hackファイル
+
+    Returns:
+        list: 16bitの機械語のリスト
+    """
+    with open(path) as f:
+        return [int(line, 2) for line in f if line.strip()]
+
+
+def assemble(asm_file, symbols=False):
+    """projects/06のAssemblerで.asmファイルをアセンブルする．
+
+    Args:
+        asm_file (string): .asmファイル
+        symbols (boolean): シンボルファイルも書き出すか
+
+    Returns:
+        list: 16bitの機械語のリスト
+    """
+    command = [sys.executable, ASSEMBLER, asm_file]
+    if symbols:
+        command.append('--symbols')
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return loadHack(asm_file[:-len('.asm')] + '_generated.hack')
+
+
+def runTest(tst_file, asm_file):
+    """.tstスクリプトのうち，CPUEmulatorの基本的なコマンドだけを解釈して実行し，
+    結果が.cmpの値と一致するかを調べる．
+
+    Args:
+        tst_file (string): .tstファイル
+        asm_file (string): テスト対象の.asmファイル
+
+    Returns:
+        tuple: (一致したか, 出力した値, .cmpの値, CPUEmulator)
+    """
+    with open(tst_file) as f:
+        script = re.sub(r'//[^\n]*', '', f.read())
+    script = re.sub(r'repeat\s+(\d+)\s*\{[^}]*\}', r'repeat \1;', script)
+    directory = os.path.dirname(tst_file)
+    cpu = CPUEmulator(assemble(asm_file))
+    outputs = []
+    columns = []
+    cmp_file = None
+    for command in re.split(r'[,;]', script):
+        words = command.split()
+        if not words:
+            continue
+        if words[0] == 'compare-to':
+            cmp_file = os.path.join(directory, words[1])
+        elif words[0] == 'output-list':
+            columns = [int(re.match(r'RAM\[(\d+)\]', word).group(1))
+                       for word in words[1:]]
+        elif words[0] == 'set':
+            address = int(re.match(r'RAM\[(\d+)\]', words[1]).group(1))
+            cpu.ram[address] = int(words[2]) & 0xffff
+        elif words[0] == 'repeat':
+            cpu.run(int(words[1]))
+        elif words[0] == 'output':
+            outputs.append([_signed(cpu.ram[column]) for column in columns])
+
+    with open(cmp_file) as f:
+        rows = [line.strip().strip('|').split('|') for line in f]
+    expected = [[int(value) for value in row] for row in rows
+                if row[0].strip().lstrip('-').isdigit()]
+    if len(expected) != len(outputs):
+        # 横に長い出力は.cmpで複数行に折り返されている
+        expected = [[value for row in expected for value in row]]
+        outputs = [[value for row in outputs for value in row]]
+    return outputs == expected, outputs, expected, cpu
+
+
+def _signed(value):
+    return value - 0x10000 if value & 0x8000 else value
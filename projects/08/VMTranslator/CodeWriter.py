@@ -1,18 +1,259 @@
 from enums import Enums
+import io
+import os
 import sys
 
+# VMのコマンド名やセグメント名からEnumへの表
+_ARITHMETICS = {arithmetic.value: arithmetic
+                for arithmetic in Enums.Arithmetic}
+_SEGMENTS = {segment.value: segment for segment in Enums.MemorySegment}
+_COMPARISONS = (Enums.Arithmetic.EQ, Enums.Arithmetic.GT, Enums.Arithmetic.LT)
+
+# 比較以外の算術コマンドのアセンブリコード
+_ARITHMETIC_CODES = {
+    Enums.Arithmetic.ADD: ['@SP', 'M=M-1', 'A=M', 'D=M', 'A=A-1', 'M=D+M'],
+    Enums.Arithmetic.SUB: ['@SP', 'M=M-1', 'A=M', 'D=M', 'A=A-1', 'M=M-D'],
+    Enums.Arithmetic.AND: ['@SP', 'M=M-1', 'A=M', 'D=M', 'A=A-1', 'M=D&M'],
+    Enums.Arithmetic.OR: ['@SP', 'M=M-1', 'A=M', 'D=M', 'A=A-1', 'M=D|M'],
+    Enums.Arithmetic.NEG: ['@SP', 'M=M-1', 'A=M', 'M=-M', '@SP', 'M=M+1'],
+    Enums.Arithmetic.NOT: ['@SP', 'M=M-1', 'A=M', 'M=!M', '@SP', 'M=M+1']
+}
+
+# ベースアドレスをポインタで持つセグメント
+_SEGMENT_POINTERS = {
+    Enums.MemorySegment.LOCAL: 'LCL',
+    Enums.MemorySegment.ARGUMENT: 'ARG',
+    Enums.MemorySegment.THIS: 'THIS',
+    Enums.MemorySegment.THAT: 'THAT'
+}
+# アドレスが固定されているセグメントの先頭アドレス
+_SEGMENT_BASES = {
+    Enums.MemorySegment.POINTER: 3,
+    Enums.MemorySegment.TEMP: 5
+}
+# 出力をまとめて書き込むまでにためておく行数
+_BUFFER_LINES = 4096
+
+# 関数の先頭でローカル変数の初期化をループにせず展開する上限
+_UNROLLED_LOCALS = 8
+
+# テンプレートを前もって作っておくLCL/ARG/THIS/THATのインデックスの範囲
+_TEMPLATE_INDICES = 16
+
+# Dの値をpushする / popした値をDに読み込む
+_PUSH_D = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+_POP_D = ['@SP', 'AM=M-1', 'D=M']
+
+
+def _buildLoad(segment, index, static_var=None):
+    """セグメントの値をDに読み込む最短のアセンブリコードを作る．
+
+    Args:
+        segment (MemorySegment): メモリセグメント
+        index (int): インデックス
+        static_var (string): staticの変数名の接頭辞
+
+    Returns:
+        list: アセンブリコード
+    """
+    if segment is Enums.MemorySegment.CONSTANT:
+        if index in (0, 1):
+            return ['D=%d' % index]
+        return ['@%d' % index, 'D=A']
+    if segment is Enums.MemorySegment.STATIC:
+        return ['@%s.%d' % (static_var, index), 'D=M']
+    if segment in _SEGMENT_BASES:
+        return ['@R%d' % (_SEGMENT_BASES[segment] + index), 'D=M']
+    if segment in _SEGMENT_POINTERS:
+        pointer = '@%s' % _SEGMENT_POINTERS[segment]
+        return min([
+            [pointer, 'D=M', '@%d' % index, 'A=D+A', 'D=M'],
+            [pointer] + _incrementA(index) + ['D=M']
+        ], key=len)
+    print("Invalid .vm format")
+    sys.exit(1)
+
+
+def _buildStore(segment, index, static_var=None):
+    """Dの値をセグメントに書き込む最短のアセンブリコードを作る．R13を使うことがある．
+
+    Args:
+        segment (MemorySegment): メモリセグメント
+        index (int): インデックス
+        static_var (string): staticの変数名の接頭辞
+
+    Returns:
+        list: アセンブリコード
+    """
+    if segment is Enums.MemorySegment.CONSTANT:
+        return []
+    if segment is Enums.MemorySegment.STATIC:
+        return ['@%s.%d' % (static_var, index), 'M=D']
+    if segment in _SEGMENT_BASES:
+        return ['@R%d' % (_SEGMENT_BASES[segment] + index), 'M=D']
+    if segment in _SEGMENT_POINTERS:
+        pointer = '@%s' % _SEGMENT_POINTERS[segment]
+        return min([
+            # 値をR13に退避し，D=アドレス+値 から A=アドレス，M=値 を取り出す
+            ['@R13', 'M=D', pointer, 'D=M', '@%d' % index, 'D=D+A',
+             '@R13', 'D=D+M', 'A=D-M', 'M=D-A'],
+            [pointer] + _incrementA(index) + ['M=D']
+        ], key=len)
+    print("Invalid .vm format")
+    sys.exit(1)
+
+
+def _buildPush(segment, index, static_var=None):
+    """pushの最短のアセンブリコードを作る．
+
+    Args:
+        segment (MemorySegment): メモリセグメント
+        index (int): インデックス
+        static_var (string): staticの変数名の接頭辞
+
+    Returns:
+        list: アセンブリコード
+    """
+    candidates = [_buildLoad(segment, index, static_var) + _PUSH_D]
+    if segment is Enums.MemorySegment.CONSTANT and index in (0, 1):
+        candidates.append(['@SP', 'AM=M+1', 'A=A-1', 'M=%d' % index])
+    return min(candidates, key=len)
+
+
+def _buildPop(segment, index, static_var=None):
+    """popの最短のアセンブリコードを作る．
+
+    Args:
+        segment (MemorySegment): メモリセグメント
+        index (int): インデックス
+        static_var (string): staticの変数名の接頭辞
+
+    Returns:
+        list: アセンブリコード
+    """
+    if segment is Enums.MemorySegment.CONSTANT:
+        return ['@SP', 'M=M-1']
+    candidates = [_POP_D + _buildStore(segment, index, static_var)]
+    if segment in _SEGMENT_POINTERS:
+        # D=アドレス+値 から A=アドレス，M=値 を取り出す
+        candidates.append([
+            '@%s' % _SEGMENT_POINTERS[segment],
+            'D=M',
+            '@%d' % index,
+            'D=D+A',
+            '@SP',
+            'AM=M-1',
+            'D=D+M',
+            'A=D-M',
+            'M=D-A'
+        ])
+    return min(candidates, key=len)
+
+
+def _incrementA(index):
+    # A=Mの後，Aにインデックスを1ずつ足す
+    if index == 0:
+        return ['A=M']
+    return ['A=M+1'] + ['A=A+1'] * (index - 1)
+
+
+def _buildAddress(segment, index, static_var=None):
+    """Dを変えずに，セグメントのアドレスをAに入れるアセンブリコードを作る．
+
+    Args:
+        segment (MemorySegment): メモリセグメント
+        index (int): インデックス
+        static_var (string): staticの変数名の接頭辞
+
+    Returns:
+        list: アセンブリコード
+    """
+    if segment is Enums.MemorySegment.STATIC:
+        return ['@%s.%d' % (static_var, index)]
+    if segment in _SEGMENT_BASES:
+        return ['@R%d' % (_SEGMENT_BASES[segment] + index)]
+    if segment in _SEGMENT_POINTERS:
+        return ['@%s' % _SEGMENT_POINTERS[segment]] + _incrementA(index)
+    print("Invalid .vm format")
+    sys.exit(1)
+
+
+def _buildIndexedAddress(segment, index):
+    """Dを使って，LCL/ARG/THIS/THATが指すセグメントのアドレスをAに入れるアセンブリコードを作る．
+    インデックスが大きい場合は，_buildAddressのようにA=A+1を繰り返すより短い．
+
+    Args:
+        segment (MemorySegment): LOCAL, ARGUMENT, THIS or THAT
+        index (int): インデックス
+
+    Returns:
+        list: アセンブリコード
+    """
+    return ['@%s' % _SEGMENT_POINTERS[segment], 'D=M', '@%d' % index, 'A=D+A']
+
+
+def _buildTemplates(build, constants=True):
+    keys = [(Enums.MemorySegment.CONSTANT, index)
+            for index in ((0, 1) if constants else ())]
+    for segment in _SEGMENT_BASES:
+        size = 8 if segment is Enums.MemorySegment.TEMP else 2
+        keys += [(segment, index) for index in range(size)]
+    for segment in _SEGMENT_POINTERS:
+        keys += [(segment, index) for index in range(_TEMPLATE_INDICES)]
+    return {key: build(*key) for key in keys}
+
+
+# (セグメント, インデックス)ごとの最短のコードの表．staticはファイルごとに異なるので含めない
+_LOAD_TEMPLATES = _buildTemplates(_buildLoad)
+_STORE_TEMPLATES = _buildTemplates(_buildStore)
+_PUSH_TEMPLATES = _buildTemplates(_buildPush)
+_POP_TEMPLATES = _buildTemplates(_buildPop)
+_ADDRESS_TEMPLATES = _buildTemplates(_buildAddress, constants=False)
+
+# 分岐するコマンドごとの，Dに対する比較と条件．
+# notはビット反転なので，!Dが0でない（Dが-1でない）ときに分岐する
+_JUMPS = {
+    None: ('D', 'JNE'),
+    Enums.Arithmetic.NOT: ('D+1', 'JNE'),
+    Enums.Arithmetic.EQ: ('D', 'JEQ'),
+    Enums.Arithmetic.GT: ('D', 'JGT'),
+    Enums.Arithmetic.LT: ('D', 'JLT')
+}
+_NEGATED_JUMPS = {
+    'JNE': 'JEQ',
+    'JEQ': 'JNE',
+    'JGT': 'JLE',
+    'JLT': 'JGE'
+}
+
 
 class CodeWriter:
 
-    def __init__(self, output_file):
+    def __init__(self, output_file, compact_calls=False,
+                 shared_comparisons=False, stack_caching=False):
         """出力ファイルを開き，書き込む準備を行う
 
         Args:
-            output_file (string): 出力ファイル名
+            output_file (string): 出力ファイル名．Noneの場合はメモリ上に書く
+            compact_calls (boolean): call/returnを共有ルーチン経由で行うか
+            shared_comparisons (boolean): eq/gt/ltを共有ルーチン経由で行うか
+            stack_caching (boolean): スタックの先頭をDに保持するか
         """
-        self.output = open(output_file, 'w')
-        self.static_var = output_file[:-3]
+        self.output = io.StringIO() if output_file is None \
+            else open(output_file, 'w')
+        self.in_memory = output_file is None
+        self._buffer = []
+        self.static_var = ''
         self.label_ctr = [0, 0, 0, 0]  # EQ, GT, LT, call
+        self.compact_calls = compact_calls
+        self.uses_shared_calls = False
+        self.shared_comparisons = shared_comparisons
+        self.used_comparisons = []
+        self.instruction_count = 0
+        self.function_name = ''
+        self.stack_caching = stack_caching
+        # Trueの間，スタックの先頭はRAMではなくDにあり，SPはその分少ない
+        self.top_in_d = False
 
     def setFileName(self, file_name):
         """CodeWriterモジュールに新しいVMファイルの変換が開始したことを知らせる．
@@ -20,7 +261,32 @@ class CodeWriter:
         Args:
             file_name (string): 変換元のファイル（.vm）
         """
-        return
+        self.static_var = os.path.splitext(os.path.basename(file_name))[0]
+        self.label_ctr = [0, 0, 0, 0]
+        self.function_name = ''
+
+    def endFile(self):
+        """現在のVMファイルの変換を終える．Dに保持しているスタックの先頭を書き戻す．
+        """
+        self._flushTop()
+
+    def writeTranslated(self, codes, instruction_count, uses_shared_calls,
+                        used_comparisons):
+        """別のCodeWriterで変換済みのVMファイルのアセンブリコードを書き込む．
+
+        Args:
+            codes (string): アセンブリコード
+            instruction_count (int): codesの命令数
+            uses_shared_calls (boolean): $CALL/$RETURNを使うか
+            used_comparisons (list): 使った比較の共有ルーチン
+        """
+        self._flushBuffer()
+        self.output.write(codes)
+        self.instruction_count += instruction_count
+        self.uses_shared_calls |= uses_shared_calls
+        for command in used_comparisons:
+            if command not in self.used_comparisons:
+                self.used_comparisons.append(command)
 
     def writeArithmetic(self, command):
         """与えられた算術コマンドをアセンブリコードに変換し，それを書き込む
@@ -28,136 +294,53 @@ class CodeWriter:
         Args:
             command (string): 算術コマンド
         """
-        _command = command.upper()
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.ADD:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'M=D+M'
-            ])
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.SUB:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'M=M-D'
-            ])
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.EQ:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'D=M-D',
-                # jump to EQTRUE# if result is equal(zero)
-                '@EQTRUE%d' % self.label_ctr[0],
-                'D;JEQ',
-                # result is not equal
-                '@SP',
-                'A=M-1',
-                'M=0',
-                '@EQEND%d' % self.label_ctr[0],
-                '0;JMP',
-                '(EQTRUE%d)' % self.label_ctr[0],
-                '@SP',
-                'A=M-1',
-                'M=-1',
-                '(EQEND%d)' % self.label_ctr[0]
-            ])
+        _command = _ARITHMETICS[command]
+        if _command in _COMPARISONS:
+            if self.shared_comparisons:
+                self._flushTop()
+                self._writeSharedComparison(_command)
+                return
+        if self.stack_caching:
+            self._writeCachedArithmetic(_command)
+            return
 
-            self.label_ctr[0] += 1
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.GT:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'D=M-D',
-                # jump to EQTRUE# if result is equal(zero)
-                '@GTTRUE%d' % self.label_ctr[1],
-                'D;JGT',
-                # result is not equal
-                '@SP',
-                'A=M-1',
-                'M=0',
-                '@GTEND%d' % self.label_ctr[1],
-                '0;JMP',
-                '(GTTRUE%d)' % self.label_ctr[1],
-                '@SP',
-                'A=M-1',
-                'M=-1',
-                '(GTEND%d)' % self.label_ctr[1]
-            ])
+        codes = _ARITHMETIC_CODES.get(_command)
+        if codes is None:
+            self._writeComparison(_command)
+        else:
+            self._writeCodes(codes)
 
-            self.label_ctr[1] += 1
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.LT:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'D=M-D',
-                # jump to EQTRUE# if result is equal(zero)
-                '@LTTRUE%d' % self.label_ctr[2],
-                'D;JLT',
-                # result is not equal
-                '@SP',
-                'A=M-1',
-                'M=0',
-                '@LTEND%d' % self.label_ctr[2],
-                '0;JMP',
-                '(LTTRUE%d)' % self.label_ctr[2],
-                '@SP',
-                'A=M-1',
-                'M=-1',
-                '(LTEND%d)' % self.label_ctr[2]
-            ])
+    def _writeComparison(self, command):
+        """eq, gt, ltを，その場で分岐するアセンブリコードとして書く．
 
-            self.label_ctr[2] += 1
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.AND:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'M=D&M'
-            ])
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.OR:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'D=M',
-                'A=A-1',
-                'M=D|M'
-            ])
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.NEG:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'M=-M',
-                '@SP',
-                'M=M+1'
-            ])
-        if Enums.Arithmetic[_command] is Enums.Arithmetic.NOT:
-            self._writeCodes([
-                '@SP',
-                'M=M-1',
-                'A=M',
-                'M=!M',
-                '@SP',
-                'M=M+1'
-            ])
+        Args:
+            command (Arithmetic): EQ, GT or LT
+        """
+        index = _COMPARISONS.index(command)
+        self._writeCodes([
+            '@SP',
+            'M=M-1',
+            'A=M',
+            'D=M',
+            'A=A-1',
+            'D=M-D',
+            # 条件を満たせばTRUEへジャンプする
+            '@' + self._uniqueLabel(command.name + 'TRUE', index),
+            'D;J%s' % command.name,
+            # 満たさない場合
+            '@SP',
+            'A=M-1',
+            'M=0',
+            '@' + self._uniqueLabel(command.name + 'END', index),
+            '0;JMP',
+            '(%s)' % self._uniqueLabel(command.name + 'TRUE', index),
+            '@SP',
+            'A=M-1',
+            'M=-1',
+            '(%s)' % self._uniqueLabel(command.name + 'END', index)
+        ])
+
+        self.label_ctr[index] += 1
 
     def writePushPop(self, command, segment, index):
         """C_PUSHまたはC_POPコマンドをアセンブリコードに変換し，それを書き込む
@@ -167,165 +350,129 @@ class CodeWriter:
             segment (string): メモリセグメント
             index (int): インデックス
         """
-        _segment = segment.upper()
+        if self.stack_caching:
+            self._writeCachedPushPop(command, segment, index)
+            return
+
+        _segment = _SEGMENTS[segment]
         if command == Enums.Command.C_PUSH:
-            if Enums.MemorySegment[_segment] is \
-                    Enums.MemorySegment.CONSTANT:
-                self._writeCodes([
-                    '@%d' % index,
-                    'D=A',
-                    '@SP',
-                    'A=M',
-                    'M=D'
-                ])
-            elif Enums.MemorySegment[_segment] in [
-                Enums.MemorySegment.ARGUMENT,
-                Enums.MemorySegment.LOCAL,
-                Enums.MemorySegment.THIS,
-                Enums.MemorySegment.THAT,
-                Enums.MemorySegment.POINTER,
-                Enums.MemorySegment.TEMP
-            ]:
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.ARGUMENT:
-                    self._writeCodes([
-                        '@ARG',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.LOCAL:
-                    self._writeCodes([
-                        '@LCL',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.THIS:
-                    self._writeCodes([
-                        '@THIS',
-                        'A=D+M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.THAT:
-                    self._writeCodes([
-                        '@THAT',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.POINTER:
-                    self._writeCodes([
-                        '@R3',
-                        'D=A'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.TEMP:
-                    self._writeCodes([
-                        '@R5',
-                        'D=A'
-                    ])
-
-                self._writeCodes([
-                    '@%d' % index,
-                    'A=D+A',
-                    'D=M',
-                    '@SP',
-                    'A=M',
-                    'M=D'
-                ])
-            elif Enums.MemorySegment[_segment] is \
-                    Enums.MemorySegment.STATIC:
-                self._writeCodes([
-                    '@%s.%d' % (self.static_var, index),
-                    'D=M',
-                    '@SP',
-                    'A=M',
-                    'M=D'
-                ])
-            else:
-                print("Invalid .vm format")
-                sys.exit(1)
+            self._writeCodes(self._template(_PUSH_TEMPLATES, _buildPush,
+                                            _segment, index))
+        if command == Enums.Command.C_POP:
+            self._writeCodes(self._template(_POP_TEMPLATES, _buildPop,
+                                            _segment, index))
 
+    def writeBranch(self, command, label, negate=False):
+        """比較（またはnot）とif-gotoを，1回の条件ジャンプにまとめて書く．
+
+        Args:
+            command (string): not, eq, gt, lt．Noneの場合はif-gotoと同じ
+            label (string): ラベル
+            negate (boolean): 条件を反転するか
+        """
+        _command = None if command is None else _ARITHMETICS[command]
+        comp, jump = _JUMPS[_command]
+        if negate:
+            jump = _NEGATED_JUMPS[jump]
+
+        self._loadTop()
+        if _command in _COMPARISONS:
             self._writeCodes([
                 '@SP',
-                'M=M+1'
+                'AM=M-1',
+                'D=M-D'
             ])
-        if command == Enums.Command.C_POP:
-            if Enums.MemorySegment[_segment] is \
-                    Enums.MemorySegment.CONSTANT:
-                self._writeCodes([
-                    '@SP',
-                    'M=M-1'
-                ])
-            elif Enums.MemorySegment[_segment] in [
-                Enums.MemorySegment.ARGUMENT,
-                Enums.MemorySegment.LOCAL,
-                Enums.MemorySegment.THIS,
-                Enums.MemorySegment.THAT,
-                Enums.MemorySegment.POINTER,
-                Enums.MemorySegment.TEMP
-            ]:
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.ARGUMENT:
-                    self._writeCodes([
-                        '@ARG',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.LOCAL:
-                    self._writeCodes([
-                        '@LCL',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.THIS:
-                    self._writeCodes([
-                        '@THIS',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.THAT:
-                    self._writeCodes([
-                        '@THAT',
-                        'D=M'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.POINTER:
-                    self._writeCodes([
-                        '@R3',
-                        'D=A'
-                    ])
-                if Enums.MemorySegment[_segment] is \
-                        Enums.MemorySegment.TEMP:
-                    self._writeCodes([
-                        '@R5',
-                        'D=A'
-                    ])
-
-                self._writeCodes([
-                    '@%d' % index,
-                    'D=D+A',
-                    '@R13',
-                    'M=D',
-                    '@SP',
-                    'M=M-1',
-                    'A=M',
-                    'D=M',
-                    '@R13',
-                    'A=M',
-                    'M=D'
-                ])
-            elif Enums.MemorySegment[_segment] is \
-                    Enums.MemorySegment.STATIC:
-                self._writeCodes([
-                    '@SP',
-                    'M=M-1',
-                    'A=M',
-                    'D=M',
-                    '@%s.%d' % (self.static_var, index),
-                    'M=D'
-                ])
-            else:
-                print("Invalid .vm format")
-                sys.exit(1)
+        self.top_in_d = False
+        self._writeCodes([
+            '@%s' % self._scopedLabel(label),
+            '%s;%s' % (comp, jump)
+        ])
+
+    def writeIncrement(self, segment, index, delta):
+        """push X / push constant 1 / add（sub）/ pop X を，Xの増減として書く．
+
+        Args:
+            segment (string): メモリセグメント
+            index (int): インデックス
+            delta (int): 1 or -1
+        """
+        _segment = _SEGMENTS[segment]
+        operation = ['M=M+1' if delta > 0 else 'M=M-1']
+        candidates = []
+        if _segment not in _SEGMENT_POINTERS or index < _TEMPLATE_INDICES:
+            candidates.append(self._template(
+                _ADDRESS_TEMPLATES, _buildAddress, _segment, index) +
+                operation)
+        if _segment in _SEGMENT_POINTERS:
+            # Dにスタックの先頭を保持している場合は，R13に退避する
+            save, restore = (['@R13', 'M=D'], ['@R13', 'D=M']) \
+                if self.top_in_d else ([], [])
+            candidates.append(save + _buildIndexedAddress(_segment, index) +
+                              operation + restore)
+        self._writeCodes(min(candidates, key=len))
+
+    def writeArrayRead(self, segment, index):
+        """push X / add / pop pointer 1 / push that 0 を書く．
+        スタックの先頭（配列のベース）にXを足したアドレスをTHATに置き，その値で先頭を置き換える．
+
+        Args:
+            segment (string): Xのメモリセグメント
+            index (int): Xのインデックス
+        """
+        _segment = _SEGMENTS[segment]
+        if _segment is Enums.MemorySegment.CONSTANT:
+            operand = ['@%d' % index, 'D=D+A']
+        else:
+            candidates = []
+            if _segment not in _SEGMENT_POINTERS \
+                    or index < _TEMPLATE_INDICES:
+                candidates.append(self._template(
+                    _ADDRESS_TEMPLATES, _buildAddress, _segment, index) +
+                    ['D=D+M'])
+            if _segment in _SEGMENT_POINTERS:
+                # 配列のベースをR13に退避してからXを読んで足す
+                candidates.append(
+                    ['@R13', 'M=D'] + _buildIndexedAddress(_segment, index) +
+                    ['D=M', '@R13', 'D=D+M'])
+            operand = min(candidates, key=len)
+        read = [
+            '@THAT',
+            'M=D',
+            'A=D',
+            'D=M'
+        ]
+
+        if self.stack_caching:
+            self._loadTop()
+            self._writeCodes(operand + read)
+            return
+        self._writeCodes(['@SP', 'A=M-1', 'D=M'] + operand + read +
+                         ['@SP', 'A=M-1', 'M=D'])
+
+    def writeArrayWrite(self, index):
+        """pop temp i / pop pointer 1 / push temp i / pop that 0 を書く．
+        スタックの先頭の値を，その下にあるアドレスに書き込む．
+
+        Args:
+            index (int): 値を経由させるtempのインデックス
+        """
+        temp = '@R%d' % (_SEGMENT_BASES[Enums.MemorySegment.TEMP] + index)
+        self._loadTop()
+        self.top_in_d = False
+        self._writeCodes([
+            temp,
+            'M=D',
+            '@SP',
+            'AM=M-1',
+            'D=M',
+            '@THAT',
+            'M=D',
+            temp,
+            'D=M',
+            '@THAT',
+            'A=M',
+            'M=D'
+        ])
 
     def writeInit(self):
         """VMの初期化を行うアセンブリコードを書く．このコードは出力ファイルの戦闘に配置しなければならない．
@@ -344,8 +491,9 @@ class CodeWriter:
         Args:
             label (string): ラベル
         """
+        self._flushTop()
         self._writeCodes([
-            '(%s)' % label
+            '(%s)' % self._scopedLabel(label)
         ])
 
     def writeGoto(self, label):
@@ -354,8 +502,9 @@ class CodeWriter:
         Args:
             label (string): ラベル
         """
+        self._flushTop()
         self._writeCodes([
-            '@%s' % label,
+            '@%s' % self._scopedLabel(label),
             '0;JMP'
         ])
 
@@ -365,12 +514,21 @@ class CodeWriter:
         Args:
             label (string): ラベル
         """
+        if self.stack_caching:
+            self._loadTop()
+            self.top_in_d = False
+            self._writeCodes([
+                '@%s' % self._scopedLabel(label),
+                'D;JNE'
+            ])
+            return
+
         self._writeCodes([
             '@SP',
             'M=M-1',
             'A=M',
             'D=M',
-            '@%s' % label,
+            '@%s' % self._scopedLabel(label),
             'D;JNE'
         ])
 
@@ -381,8 +539,13 @@ class CodeWriter:
             functionName (string): 関数名
             numArgs (int): 引数の個数
         """
+        self._flushTop()
+        if self.compact_calls:
+            self._writeSharedCall(functionName, numArgs)
+            return
+
         self._writeCodes([
-            '@%s.RETURN%d' % (functionName, self.label_ctr[3]),
+            '@' + self._uniqueLabel(functionName + '.RETURN', 3),
             'D=A',
             '@SP',
             'A=M',
@@ -452,7 +615,7 @@ class CodeWriter:
         self._writeCodes([
             '@%s' % functionName,
             '0;JMP',
-            '(%s.RETURN%d)' % (functionName, self.label_ctr[3]),
+            '(%s)' % self._uniqueLabel(functionName + '.RETURN', 3),
         ])
 
         self.label_ctr[3] += 1
@@ -460,6 +623,15 @@ class CodeWriter:
     def writeReturn(self):
         """returnコマンドを行うアセンブリコードを書く．
         """
+        self._flushTop()
+        if self.compact_calls:
+            self.uses_shared_calls = True
+            self._writeCodes([
+                '@$RETURN',
+                '0;JMP'
+            ])
+            return
+
         self._writeCodes([
             '@LCL',
             'D=M',
@@ -544,49 +716,388 @@ class CodeWriter:
             functionName (string): 関数名
             numLocals (int): ローカル変数の個数
         """
+        self._flushTop()
+        self.function_name = functionName
+        self._writeCodes([
+            '(%s)' % functionName
+        ])
+
+        if numLocals == 0:
+            return
+        if numLocals == 1:
+            self._writeCodes(_PUSH_TEMPLATES[
+                (Enums.MemorySegment.CONSTANT, 0)])
+            return
+        if numLocals <= _UNROLLED_LOCALS:
+            # 0を並べて書き，SPは最後にまとめて進める
+            self._writeCodes(
+                ['@SP', 'A=M', 'M=0'] + ['A=A+1', 'M=0'] * (numLocals - 1) +
+                ['D=A+1', '@SP', 'M=D'])
+            return
+
+        # Dを残りの個数として数える
         self._writeCodes([
-            '(%s)' % functionName,
             '@%d' % numLocals,
             'D=A',
-            '@%s.kcnt' % functionName,
-            'M=D'
+            '(%s.LOCALS)' % functionName,
+            '@SP',
+            'AM=M+1',
+            'A=A-1',
+            'M=0',
+            'D=D-1',
+            '@%s.LOCALS' % functionName,
+            'D;JGT'
         ])
 
+    def _writeCachedArithmetic(self, command):
+        """スタックの先頭をDに置いたまま算術コマンドを書く．結果もDに残す．
+
+        Args:
+            command (Arithmetic): 算術コマンド
+        """
+        self._loadTop()
+        if command is Enums.Arithmetic.NEG:
+            self._writeCodes(['D=-D'])
+            return
+        if command is Enums.Arithmetic.NOT:
+            self._writeCodes(['D=!D'])
+            return
+
+        # 2つ目の引数はD，1つ目はRAM[SP-1]にある
+        comp = {
+            Enums.Arithmetic.ADD: 'D=D+M',
+            Enums.Arithmetic.SUB: 'D=M-D',
+            Enums.Arithmetic.AND: 'D=D&M',
+            Enums.Arithmetic.OR: 'D=D|M'
+        }.get(command, 'D=M-D')
         self._writeCodes([
-            '(%s.kloop)' % functionName
+            '@SP',
+            'AM=M-1',
+            comp
         ])
+        if command not in _COMPARISONS:
+            return
 
+        index = _COMPARISONS.index(command)
         self._writeCodes([
-            '@%s.kcnt' % functionName,
-            'D=M',
-            '@%s.END' % functionName,
-            'D;JLE'
+            '@' + self._uniqueLabel(command.name + 'TRUE', index),
+            'D;J%s' % command.name,
+            'D=0',
+            '@' + self._uniqueLabel(command.name + 'END', index),
+            '0;JMP',
+            '(%s)' % self._uniqueLabel(command.name + 'TRUE', index),
+            'D=-1',
+            '(%s)' % self._uniqueLabel(command.name + 'END', index)
         ])
 
+        self.label_ctr[index] += 1
+
+    def _writeCachedPushPop(self, command, segment, index):
+        """スタックの先頭をDに置いたままpush/popを書く．
+        pushした値はDに残し，直前にDにあった値だけをRAMに書き戻す．
+
+        Args:
+            command (command): C_PUSH or C_POP
+            segment (string): メモリセグメント
+            index (int): インデックス
+        """
+        _segment = _SEGMENTS[segment]
+        if command == Enums.Command.C_PUSH:
+            self._flushTop()
+            self._writeCodes(self._template(_LOAD_TEMPLATES, _buildLoad,
+                                            _segment, index))
+            self.top_in_d = True
+        if command == Enums.Command.C_POP:
+            self._loadTop()
+            self._writeCodes(self._template(_STORE_TEMPLATES, _buildStore,
+                                            _segment, index))
+            self.top_in_d = False
+
+    def _template(self, templates, build, segment, index):
+        """(セグメント, インデックス)に対応するアセンブリコードを表から引く．
+        表にない場合（staticや大きいインデックス）はその場で組み立てる．
+
+        Args:
+            templates (dict): (セグメント, インデックス)からコードへの表
+            build (function): コードを組み立てる関数
+            segment (MemorySegment): メモリセグメント
+            index (int): インデックス
+
+        Returns:
+            list: アセンブリコード
+        """
+        if segment is Enums.MemorySegment.STATIC:
+            return build(segment, index, self.static_var)
+        codes = templates.get((segment, index))
+        if codes is None:
+            codes = build(segment, index)
+        return codes
+
+    def _loadTop(self):
+        """スタックの先頭がDになければ，popしてDに読み込む．
+        """
+        if not self.top_in_d:
+            self.top_in_d = True
+            self._writeCodes([
+                '@SP',
+                'AM=M-1',
+                'D=M'
+            ])
+
+    def _flushTop(self):
+        """Dに保持しているスタックの先頭をRAMに書き戻す．
+        ラベル，ジャンプ，call，returnの前ではスタックを必ずRAMに置く．
+        """
+        if self.top_in_d:
+            self.top_in_d = False
+            self._writeCodes([
+                '@SP',
+                'AM=M+1',
+                'A=A-1',
+                'M=D'
+            ])
+
+    def _uniqueLabel(self, name, counter):
+        """コードが生成するラベルを，ファイル名を付けてファイルごとに一意にする．
+        ファイル名には.が含まれないので，VMのラベル（関数名$ラベル）とは衝突しない．
+
+        Args:
+            name (string): ラベルの種類
+            counter (int): label_ctrのどのカウンタを使うか
+
+        Returns:
+            string: ファイル名$種類番号
+        """
+        return '%s$%s%d' % (self.static_var, name, self.label_ctr[counter])
+
+    def _scopedLabel(self, label):
+        """VMのラベルは関数内でのみ有効なので，関数名を付けて一意にする．
+
+        Args:
+            label (string): ラベル
+
+        Returns:
+            string: 関数名$ラベル
+        """
+        if self.function_name:
+            return '%s$%s' % (self.function_name, label)
+        return label
+
+    def _writeSharedCall(self, functionName, numArgs):
+        """呼び出し先，引数の個数，リターンアドレスだけを設定して$CALLへジャンプする．
+        R13に呼び出し先，R14に引数の個数，Dにリターンアドレスを入れて渡す．
+
+        Args:
+            functionName (string): 関数名
+            numArgs (int): 引数の個数
+        """
+        self.uses_shared_calls = True
+        return_label = self._uniqueLabel(functionName + '.RETURN', 3)
+        if numArgs in (0, 1):
+            self._writeCodes([
+                '@R14',
+                'M=%d' % numArgs
+            ])
+        else:
+            self._writeCodes([
+                '@%d' % numArgs,
+                'D=A',
+                '@R14',
+                'M=D'
+            ])
+
         self._writeCodes([
-            '@0',
+            '@%s' % functionName,
+            'D=A',
+            '@R13',
+            'M=D',
+            '@%s' % return_label,
             'D=A',
+            '@$CALL',
+            '0;JMP',
+            '(%s)' % return_label
+        ])
+
+        self.label_ctr[3] += 1
+
+    def _writeSharedRoutines(self):
+        """compact_callsの場合に，全てのcall/returnが共有する$CALLと$RETURNを書く．
+        """
+        self._writeCodes([
+            '($CALL)',
+            # リターンアドレス，LCL，ARG，THIS，THATをpushする
             '@SP',
             'A=M',
             'M=D',
+            '@LCL',
+            'D=M',
             '@SP',
-            'M=M+1'
+            'AM=M+1',
+            'M=D',
+            '@ARG',
+            'D=M',
+            '@SP',
+            'AM=M+1',
+            'M=D',
+            '@THIS',
+            'D=M',
+            '@SP',
+            'AM=M+1',
+            'M=D',
+            '@THAT',
+            'D=M',
+            '@SP',
+            'AM=M+1',
+            'M=D',
+            '@SP',
+            'MD=M+1',
+            # LCL = SP, ARG = SP - n - 5
+            '@LCL',
+            'M=D',
+            '@R14',
+            'D=D-M',
+            '@5',
+            'D=D-A',
+            '@ARG',
+            'M=D',
+            '@R13',
+            'A=M',
+            '0;JMP'
         ])
 
         self._writeCodes([
-            '@%s.kcnt' % functionName,
-            'M=M-1'
+            '($RETURN)',
+            # FRAME = LCL をR14に，RET = *(FRAME-5) をR15に置く
+            '@LCL',
+            'D=M',
+            '@R14',
+            'M=D',
+            '@5',
+            'A=D-A',
+            'D=M',
+            '@R15',
+            'M=D',
+            # *ARG = pop(), SP = ARG + 1
+            '@SP',
+            'AM=M-1',
+            'D=M',
+            '@ARG',
+            'A=M',
+            'M=D',
+            '@ARG',
+            'D=M+1',
+            '@SP',
+            'M=D',
+            # THAT, THIS, ARG, LCLを復元する
+            '@R14',
+            'AM=M-1',
+            'D=M',
+            '@THAT',
+            'M=D',
+            '@R14',
+            'AM=M-1',
+            'D=M',
+            '@THIS',
+            'M=D',
+            '@R14',
+            'AM=M-1',
+            'D=M',
+            '@ARG',
+            'M=D',
+            '@R14',
+            'AM=M-1',
+            'D=M',
+            '@LCL',
+            'M=D',
+            '@R15',
+            'A=M',
+            '0;JMP'
         ])
 
+    def _writeSharedComparison(self, command):
+        """リターンアドレスをDに入れて，比較コマンドの共有ルーチンへジャンプする．
+
+        Args:
+            command (Arithmetic): EQ, GT or LT
+        """
+        index = _COMPARISONS.index(command)
+        if command not in self.used_comparisons:
+            self.used_comparisons.append(command)
+        return_label = self._uniqueLabel(command.name + '.RETURN', index)
         self._writeCodes([
-            '@%s.kloop' % functionName,
+            '@%s' % return_label,
+            'D=A',
+            '@$%s' % command.name,
             '0;JMP',
-            '(%s.END)' % functionName
+            '(%s)' % return_label
+        ])
+
+        self.label_ctr[index] += 1
+
+    def _writeComparisonRoutine(self, command):
+        """比較コマンドの共有ルーチンを書く．リターンアドレスはR15に退避する．
+
+        Args:
+            command (Arithmetic): EQ, GT or LT
+        """
+        self._writeCodes([
+            '($%s)' % command.name,
+            '@R15',
+            'M=D',
+            '@SP',
+            'AM=M-1',
+            'D=M',
+            'A=A-1',
+            'D=M-D',
+            'M=-1',
+            '@$%s.TRUE' % command.name,
+            'D;J%s' % command.name,
+            '@SP',
+            'A=M-1',
+            'M=0',
+            '($%s.TRUE)' % command.name,
+            '@R15',
+            'A=M',
+            '0;JMP'
         ])
 
     def _writeCodes(self, codes):
         for code in codes:
-            self.output.write(code + '\n')
+            if not code.startswith('('):
+                self.instruction_count += 1
+        self._buffer.extend(codes)
+        if len(self._buffer) >= _BUFFER_LINES:
+            self._flushBuffer()
+
+    def _flushBuffer(self):
+        if self._buffer:
+            self.output.write('\n'.join(self._buffer) + '\n')
+            self._buffer = []
+
+    def getText(self):
+        """メモリ上に書いたアセンブリコードを返す．
+
+        Returns:
+            string: アセンブリコード
+        """
+        self._flushBuffer()
+        return self.output.getvalue()
 
     def close(self):
-        self.output.close()
+        self._flushTop()
+        if self.uses_shared_calls or self.used_comparisons:
+            # プログラムの末尾から共有ルーチンへ落ちないよう，ここで止める
+            self._writeCodes([
+                '($HALT)',
+                '@$HALT',
+                '0;JMP'
+            ])
+        if self.uses_shared_calls:
+            self._writeSharedRoutines()
+        for command in _COMPARISONS:
+            if command in self.used_comparisons:
+                self._writeComparisonRoutine(command)
+        self._flushBuffer()
+        # メモリ上の場合はgetTextで読めるよう閉じない
+        if not self.in_memory:
+            self.output.close()
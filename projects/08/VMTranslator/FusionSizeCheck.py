@@ -0,0 +1,113 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import CodeWriter
+import Parser
+import SuperInstructions
+import VMTranslator
+
+# Dやスタックに値がある状態で各ウィンドウを変換するための前置き
+PREFIX = ['push constant 7', 'push constant 8']
+SEGMENTS = {
+    'local': None,
+    'argument': None,
+    'this': None,
+    'that': None,
+    'temp': 8,
+    'pointer': 2,
+    'static': 4
+}
+
+
+def windows(max_index):
+    """SuperInstructionsがまとめる各パターンのVMコマンドの並びを作る．
+
+    Args:
+        max_index (int): LCL/ARG/THIS/THATで試すインデックスの上限
+
+    Yields:
+        list: VMコマンドの行のリスト
+    """
+    indices = list(range(max_index + 1)) + [100, 1000, 32767]
+    for segment, size in SEGMENTS.items():
+        for index in (range(size) if size else indices):
+            x = '%s %d' % (segment, index)
+            yield ['push ' + x, 'push constant 1', 'add', 'pop ' + x]
+            yield ['push ' + x, 'push constant 1', 'sub', 'pop ' + x]
+            yield ['push constant 1', 'push ' + x, 'add', 'pop ' + x]
+            yield ['push ' + x, 'add', 'pop pointer 1', 'push that 0']
+    for index in indices[:3]:
+        yield ['push constant %d' % index, 'add', 'pop pointer 1',
+               'push that 0']
+    for index in range(8):
+        yield ['pop temp %d' % index, 'pop pointer 1',
+               'push temp %d' % index, 'pop that 0']
+    for comparison in ('eq', 'gt', 'lt'):
+        yield [comparison, 'if-goto L']
+        yield [comparison, 'not', 'if-goto L']
+        yield [comparison, 'if-goto A', 'goto B', 'label A']
+    yield ['not', 'if-goto L']
+    yield ['not', 'not']
+    yield ['if-goto A', 'goto B', 'label A']
+    yield ['goto L', 'label L']
+
+
+def translatedSize(input_file, options, fuse):
+    """.vmファイルを変換したときの命令数を返す．
+
+    Args:
+        input_file (string): .vmファイル
+        options (dict): CodeWriterに渡すオプション
+        fuse (boolean): SuperInstructionsでまとめるか
+
+    Returns:
+        int: 命令数
+    """
+    translator = VMTranslator.VMTranslator()
+    writer = CodeWriter.CodeWriter(None, **options)
+    fuser = SuperInstructions.SuperInstructions() if fuse else None
+    translator._translate(
+        input_file, translator._commands(Parser.Parser(input_file)),
+        writer, fuser)
+    return writer.instruction_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check that no fused window is longer than its '
+                    'unfused translation')
+    parser.add_argument('--max-index', type=int, default=40,
+                        help='largest local/argument/this/that index')
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp()
+    input_file = os.path.join(work, 'Check.vm')
+    failed = 0
+    checked = 0
+    try:
+        for stack_caching in (False, True):
+            for shared_comparisons in (False, True):
+                options = {'stack_caching': stack_caching,
+                           'shared_comparisons': shared_comparisons}
+                config = ' '.join(name for name, on in options.items()
+                                  if on) or '(default)'
+                for window in windows(args.max_index):
+                    with open(input_file, 'w') as f:
+                        f.writelines(line + '\n' for line in PREFIX + window)
+                    fused = translatedSize(input_file, options, True)
+                    unfused = translatedSize(input_file, options, False)
+                    checked += 1
+                    if fused > unfused:
+                        failed += 1
+                        print('%s [%s]: %d > %d' % (
+                            ' / '.join(window), config, fused, unfused))
+    finally:
+        shutil.rmtree(work)
+    print('%d windows checked, %d longer when fused' % (checked, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
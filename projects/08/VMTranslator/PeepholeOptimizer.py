@@ -0,0 +1,246 @@
+import sys
+
+# シンボルのうち，アドレスが固定されているもの
+PREDEFINED_SYMBOLS = dict(
+    [('SP', 0), ('LCL', 1), ('ARG', 2), ('THIS', 3), ('THAT', 4),
+     ('SCREEN', 16384), ('KBD', 24576)] +
+    [('R%d' % i, i) for i in range(16)])
+
+
+class PeepholeOptimizer:
+
+    def __init__(self):
+        self.stats = {}
+
+    def optimize(self, lines):
+        """Hackのアセンブリに対して，のぞき穴最適化を変化がなくなるまで繰り返す．
+        VMTranslatorの出力と同様に，RAM[SP]が0でない（スタックがSPと重ならない）ことを前提とする．
+
+        Args:
+            lines (iterable): アセンブリの行
+
+        Returns:
+            list: 最適化後のアセンブリの行（コメントと空行は除く）
+        """
+        codes = [code for code in (_format(line) for line in lines) if code]
+        changed = True
+        while changed:
+            changed = False
+            for rule in (self._fusePushPop, self._removeStoreReload,
+                         self._foldConstantAddress,
+                         self._removeJumpToNext,
+                         self._removeRedundantLoad):
+                new_codes = rule(codes)
+                if len(new_codes) != len(codes):
+                    changed = True
+                codes = new_codes
+        return codes
+
+    def _count(self, rule):
+        self.stats[rule] = self.stats.get(rule, 0) + 1
+
+    def _fusePushPop(self, codes):
+        """@SP / M=M+1 / @SP / M=M-1 を @SP にまとめる．
+        """
+        result = []
+        i = 0
+        while i < len(codes):
+            if _matchesAt(codes, i, ('@SP', 'M=M+1', '@SP', 'M=M-1')):
+                result.append('@SP')
+                self._count('push/pop fusion')
+                i += 4
+            else:
+                result.append(codes[i])
+                i += 1
+        return result
+
+    def _removeStoreReload(self, codes):
+        """スタックに書いた値を直後に読み戻す @SP / A=M / D=M を取り除く．
+        """
+        result = []
+        i = 0
+        while i < len(codes):
+            if _matchesAt(codes, i,
+                          ('@SP', 'A=M', 'M=D', '@SP', 'A=M', 'D=M')):
+                result.extend(('@SP', 'A=M', 'M=D'))
+                self._count('store/reload elimination')
+                i += 6
+            else:
+                result.append(codes[i])
+                i += 1
+        return result
+
+    def _foldConstantAddress(self, codes):
+        """@a / D=A / @b / A=D+A（または D=D+A）の定数の足し算をまとめる．
+        """
+        result = []
+        i = 0
+        while i < len(codes):
+            if i + 3 < len(codes) and codes[i+1] == 'D=A' \
+                    and codes[i+3] in ('A=D+A', 'D=D+A'):
+                a = _constant(codes[i])
+                b = _constant(codes[i+2])
+                if a is not None and b is not None and a + b < 0x8000:
+                    folded = '@%d' % (a + b)
+                    if codes[i+3] == 'A=D+A':
+                        if _isDead(codes, i + 4, 'D'):
+                            result.append(folded)
+                            self._count('constant folding')
+                            i += 4
+                            continue
+                    elif _isDead(codes, i + 4, 'A'):
+                        result.extend([folded, 'D=A'])
+                        self._count('constant folding')
+                        i += 4
+                        continue
+            # オフセットが0の場合: D=M / @0 / A=D+A → A=M
+            if _matchesAt(codes, i, ('D=M', '@0', 'A=D+A')) \
+                    and _isDead(codes, i + 3, 'D'):
+                result.append('A=M')
+                self._count('constant folding')
+                i += 3
+                continue
+            if _matchesAt(codes, i, ('D=M', '@0', 'D=D+A')) \
+                    and _isDead(codes, i + 3, 'A'):
+                result.append('D=M')
+                self._count('constant folding')
+                i += 3
+                continue
+            result.append(codes[i])
+            i += 1
+        return result
+
+    def _removeJumpToNext(self, codes):
+        """直後のラベルへのジャンプ（@L / 0;JMP / (L)）を取り除く．
+        """
+        result = []
+        i = 0
+        while i < len(codes):
+            code = codes[i]
+            if code.startswith('@') and i + 1 < len(codes) \
+                    and _jump(codes[i+1]) and _isPure(codes[i+1]):
+                label = '(%s)' % code[1:]
+                j = i + 2
+                while j < len(codes) and codes[j].startswith('('):
+                    if codes[j] == label:
+                        break
+                    j += 1
+                if j < len(codes) and codes[j] == label \
+                        and _isDead(codes, j + 1, 'A'):
+                    self._count('jump to next removal')
+                    i += 2
+                    continue
+            result.append(code)
+            i += 1
+        return result
+
+    def _removeRedundantLoad(self, codes):
+        """Aレジスタが既に同じ値を保持している @X を取り除く．
+        """
+        result = []
+        current = None
+        for code in codes:
+            if code.startswith('('):
+                current = None
+            elif code.startswith('@'):
+                if code == current:
+                    self._count('redundant load elimination')
+                    continue
+                current = code
+            elif 'A' in _dest(code) or _jump(code):
+                current = None
+            result.append(code)
+        return result
+
+
+def _format(line):
+    return line.split('//')[0].strip()
+
+
+def _dest(code):
+    return code.split('=')[0] if '=' in code else ''
+
+
+def _comp(code):
+    return code.split('=')[-1].split(';')[0]
+
+
+def _jump(code):
+    return code.split(';')[1] if ';' in code else ''
+
+
+def _isPure(code):
+    # 計算結果をどこにも書き込まない命令か
+    return not code.startswith(('@', '(')) and not _dest(code)
+
+
+def _constant(code):
+    symbol = code[1:]
+    if symbol.isdigit():
+        return int(symbol)
+    return PREDEFINED_SYMBOLS.get(symbol)
+
+
+def _matchesAt(codes, index, pattern):
+    """codes[index]から始まる命令がpatternと一致するか．スライスを作らずに比べる．
+    """
+    if index + len(pattern) > len(codes):
+        return False
+    for offset, code in enumerate(pattern):
+        if codes[index + offset] != code:
+            return False
+    return True
+
+
+def _isDead(codes, index, register):
+    """index以降で，registerの値が読まれる前に上書きされるかを調べる．
+    ラベルやジャンプに出会った場合は，安全側に倒して生きているとみなす．
+    """
+    # codes[index:]のようにスライスすると呼ぶたびに残り全体をコピーするので，添字で走査する
+    for j in range(index, len(codes)):
+        code = codes[j]
+        if code.startswith('('):
+            return False
+        if code.startswith('@'):
+            if register == 'A':
+                return True
+            continue
+        comp = _comp(code)
+        reads = set(comp) & {'A', 'D', 'M'}
+        if 'M' in reads or 'M' in _dest(code) or _jump(code):
+            reads.add('A')
+        if register in reads:
+            return False
+        if register in _dest(code):
+            return True
+        if _jump(code):
+            return False
+    return True
+
+
+def _countInstructions(codes):
+    return sum(1 for code in codes if not code.startswith('('))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Invalid usage")
+        sys.exit(1)
+    input_file = sys.argv[1]
+    output_file = sys.argv[2] if len(sys.argv) == 3 \
+        else input_file.replace('.asm', '_optimized.asm')
+
+    with open(input_file) as f:
+        lines = f.readlines()
+    optimizer = PeepholeOptimizer()
+    codes = optimizer.optimize(lines)
+    with open(output_file, 'w') as f:
+        f.writelines(code + '\n' for code in codes)
+
+    before = _countInstructions([_format(line) for line in lines
+                                 if _format(line)])
+    after = _countInstructions(codes)
+    for rule, count in sorted(optimizer.stats.items()):
+        print('%s: %d' % (rule, count))
+    print('instructions: %d -> %d (%.1f%%)' % (
+        before, after, 100.0 * (before - after) / before if before else 0))
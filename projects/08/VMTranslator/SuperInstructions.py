@@ -0,0 +1,172 @@
+from enums import Enums
+
+_COMPARISONS = ('eq', 'gt', 'lt')
+
+
+class Fused:
+    __slots__ = ('pattern', 'method', 'args')
+
+    def __init__(self, pattern, method, args):
+        """複数のVMコマンドをまとめた1つの命令．
+
+        Args:
+            pattern (string): まとめたパターンの名前
+            method (string): 書き出すCodeWriterのメソッド名
+            args (tuple): メソッドに渡す引数
+        """
+        self.pattern = pattern
+        self.method = method
+        self.args = args
+
+
+class SuperInstructions:
+
+    def __init__(self):
+        self.stats = {}
+
+    def fuse(self, commands):
+        """コンパイル済みのJackによく現れるVMコマンドの並びを，Fusedにまとめる．
+        コマンドを1つ追加するたびに末尾をパターンと照合し，まとめられなくなるまで繰り返す．
+
+        Args:
+            commands (iterable): (コマンドの種類, 第1引数, 第2引数) の列
+
+        Returns:
+            list: (コマンドの種類, 第1引数, 第2引数) またはFusedのリスト
+        """
+        result = []
+        for command in commands:
+            result.append(command)
+            while self._reduce(result):
+                pass
+        return result
+
+    def _reduce(self, result):
+        for rule in (self._removeDoubleNot, self._removeGotoNext,
+                     self._invertBranch, self._fuseBranch,
+                     self._fuseIncrement, self._fuseArrayRead,
+                     self._fuseArrayWrite):
+            replaced = rule(result)
+            if replaced is not None:
+                pattern, length, codes = replaced
+                self.stats[pattern] = self.stats.get(pattern, 0) + 1
+                result[-length:] = codes
+                return True
+        return False
+
+    def _removeDoubleNot(self, result):
+        """not / not は何もしない．
+        """
+        if _matches(result, ['not', 'not']):
+            return 'not; not', 2, []
+
+    def _removeGotoNext(self, result):
+        """goto L / label L のジャンプは不要．
+        """
+        if _matches(result, ['goto', 'label']) \
+                and result[-2][1] == result[-1][1]:
+            return 'goto L; label L', 2, [result[-1]]
+
+    def _invertBranch(self, result):
+        """if-goto A / goto B / label A を，条件を反転した B への分岐にする．
+        """
+        if len(result) < 3 or not _matches(result, ['goto', 'label']):
+            return None
+        branch = result[-3]
+        label = result[-1]
+        if isinstance(branch, Fused) and branch.method == 'writeBranch' \
+                and branch.args[1] == label[1]:
+            command, _, negate = branch.args
+        elif _matches(result[:-2], ['if-goto']) and branch[1] == label[1]:
+            command, negate = None, False
+        else:
+            return None
+        return 'if-goto; goto; label', 3, [
+            Fused('if-goto; goto; label', 'writeBranch',
+                  (command, result[-2][1], not negate)),
+            label]
+
+    def _fuseBranch(self, result):
+        """比較やnotの直後のif-gotoを，1回の条件ジャンプにまとめる．
+        """
+        if _matches(result, [_COMPARISONS, 'not', 'if-goto']):
+            return 'compare; not; if-goto', 3, [Fused(
+                'compare; not; if-goto', 'writeBranch',
+                (result[-3][1], result[-1][1], True))]
+        if _matches(result, [_COMPARISONS, 'if-goto']):
+            return 'compare; if-goto', 2, [Fused(
+                'compare; if-goto', 'writeBranch',
+                (result[-2][1], result[-1][1], False))]
+        if _matches(result, ['not', 'if-goto']):
+            return 'not; if-goto', 2, [Fused(
+                'not; if-goto', 'writeBranch', ('not', result[-1][1], False))]
+
+    def _fuseIncrement(self, result):
+        """push X / push constant 1 / add（sub）/ pop X を，Xの直接の増減にする．
+        """
+        if not _matches(result, ['push', 'push', ('add', 'sub'), 'pop']):
+            return None
+        first, second, operation, target = result[-4:]
+        one = (Enums.Command.C_PUSH, 'constant', 1)
+        if second == one:
+            variable = first
+        elif first == one and operation[1] == 'add':
+            variable = second
+        else:
+            return None
+        if variable[1] == 'constant' or variable[1:] != target[1:]:
+            return None
+        return 'increment', 4, [Fused(
+            'increment', 'writeIncrement',
+            (target[1], target[2], 1 if operation[1] == 'add' else -1))]
+
+    def _fuseArrayRead(self, result):
+        """push X / add / pop pointer 1 / push that 0 を1つの配列の読み出しにする．
+        """
+        if _matches(result, ['push', 'add', 'pop', 'push']) \
+                and result[-2][1:] == ('pointer', 1) \
+                and result[-1][1:] == ('that', 0):
+            return 'array read', 4, [Fused(
+                'array read', 'writeArrayRead', result[-4][1:])]
+
+    def _fuseArrayWrite(self, result):
+        """pop temp i / pop pointer 1 / push temp i / pop that 0 を配列の書き込みにする．
+        """
+        if _matches(result, ['pop', 'pop', 'push', 'pop']) \
+                and result[-4][1] == 'temp' \
+                and result[-3][1:] == ('pointer', 1) \
+                and result[-2][1:] == result[-4][1:] \
+                and result[-1][1:] == ('that', 0):
+            return 'array write', 4, [Fused(
+                'array write', 'writeArrayWrite', (result[-4][2],))]
+
+
+# パターンの各要素と照合するコマンドの種類
+_KINDS = {
+    'push': Enums.Command.C_PUSH,
+    'pop': Enums.Command.C_POP,
+    'label': Enums.Command.C_LABEL,
+    'goto': Enums.Command.C_GOTO,
+    'if-goto': Enums.Command.C_IF
+}
+
+
+def _matches(result, pattern):
+    """resultの末尾がpatternの並びと一致するか．
+    patternの要素はコマンド名（算術コマンドはその名前），またはその候補のタプル．
+    """
+    if len(result) < len(pattern):
+        return False
+    for command, expected in zip(result[len(result) - len(pattern):],
+                                 pattern):
+        if isinstance(command, Fused):
+            return False
+        names = expected if isinstance(expected, tuple) else (expected,)
+        for name in names:
+            kind = _KINDS.get(name, Enums.Command.C_ARITHMETIC)
+            if command[0] is kind and (kind is not Enums.Command.C_ARITHMETIC
+                                       or command[1] == name):
+                break
+        else:
+            return False
+    return True
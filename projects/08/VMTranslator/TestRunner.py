@@ -0,0 +1,88 @@
+import argparse
+import CPUEmulator
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+TRANSLATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'VMTranslator.py')
+
+
+def findTests():
+    """projects/07と08のCPUEmulator用の.tstを探す．
+
+    Returns:
+        list: .tstファイルのリスト
+    """
+    tests = []
+    for project in ('07', '08'):
+        for tst_file in sorted(glob.glob(
+                os.path.join(PROJECTS, project, '*', '*', '*.tst'))):
+            if not tst_file.endswith('VME.tst'):
+                tests.append(tst_file)
+    return tests
+
+
+def runTest(tst_file, config):
+    """テストのディレクトリを変換し，.tstを実行して.cmpと比較する．
+
+    Args:
+        tst_file (string): .tstファイル
+        config (string): VMTranslatorに渡すオプション
+
+    Returns:
+        tuple: (一致したか, ROMサイズ)
+    """
+    work = tempfile.mkdtemp()
+    try:
+        directory = os.path.dirname(tst_file)
+        for path in glob.glob(os.path.join(directory, '*')):
+            if path.endswith(('.vm', '.tst', '.cmp')):
+                shutil.copy(path, work)
+
+        name = os.path.basename(directory)
+        asm_file = os.path.join(work, name + '.asm')
+        options = config.split()
+        # Sys.vmのないテストはブートストラップなしでRAMを直接設定する
+        if not os.path.exists(os.path.join(work, 'Sys.vm')):
+            options.append('--no-init')
+        subprocess.run([sys.executable, TRANSLATOR, work, asm_file] + options,
+                       check=True, stdout=subprocess.DEVNULL)
+        ok, _, _, cpu = CPUEmulator.runTest(
+            os.path.join(work, os.path.basename(tst_file)), asm_file)
+        return ok, len(cpu.rom)
+    finally:
+        shutil.rmtree(work)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the projects/07 and 08 tests on the CPU emulator',
+        epilog='example: python TestRunner.py -- "" "--stack-cache"')
+    parser.add_argument('configs', nargs='*', default=[''],
+                        help='VMTranslator options, one quoted string each')
+    args = parser.parse_args(argv)
+
+    print('%-18s %s' % ('test', ' '.join(
+        '%-24s' % (config or '(default)') for config in args.configs)))
+    failed = 0
+    for tst_file in findTests():
+        columns = []
+        for config in args.configs:
+            ok, rom_size = runTest(tst_file, config)
+            failed += not ok
+            columns.append('%-24s' % ('%s (%d)' % (
+                'ok' if ok else 'FAIL', rom_size)))
+        print(('%-18s %s' % (
+            os.path.splitext(os.path.basename(tst_file))[0],
+            ' '.join(columns))).rstrip())
+    print('%d failed' % failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import argparse
+import glob
+import os
+import time
+import Parser
+import VMTranslator
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+DEFAULT_INPUTS = sorted(glob.glob(
+    os.path.join(PROJECTS, '..', 'tools', 'OS', '*.vm')))
+
+
+def measure(input_files, translate, repeat):
+    """.vmファイルを読み（translateなら変換まで行い），1秒あたりのコマンド数を測る．
+
+    Args:
+        input_files (list): .vmファイルのリスト
+        translate (boolean): メモリ上へのアセンブリの変換まで行うか
+        repeat (int): 計測回数．最も速かった回を採る
+
+    Returns:
+        tuple: (コマンド数, 1秒あたりのコマンド数)
+    """
+    translator = VMTranslator.VMTranslator()
+    commands = 0
+    best = None
+    for _ in range(repeat):
+        commands = 0
+        start = time.perf_counter()
+        for input_file in input_files:
+            if translate:
+                VMTranslator._translateFile(input_file, None, {}, False)
+            else:
+                for _ in translator._commands(Parser.Parser(input_file)):
+                    commands += 1
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    if translate:
+        commands = sum(
+            1 for input_file in input_files
+            for _ in translator._commands(Parser.Parser(input_file)))
+    return commands, commands / best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure VM commands per second for parsing and '
+                    'translation')
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS,
+                        help='.vm files (default: tools/OS/*.vm)')
+    parser.add_argument('-n', '--repeat', type=int, default=20,
+                        help='number of runs; the fastest one is reported')
+    args = parser.parse_args(argv)
+
+    print('%-12s %10s %14s' % ('stage', 'commands', 'commands/s'))
+    for stage, translate in (('parse', False), ('translate', True)):
+        commands, rate = measure(args.inputs, translate, args.repeat)
+        print('%-12s %10d %14.0f' % (stage, commands, rate))
+
+
+if __name__ == '__main__':
+    main()
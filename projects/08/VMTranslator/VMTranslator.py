@@ -1,54 +1,258 @@
+from concurrent.futures import ProcessPoolExecutor
 from enums import Enums
+import argparse
 import CodeWriter
 import glob
 import Parser
-import sys
+import PeepholeOptimizer
+import SuperInstructions
 
 
 class VMTranslator:
 
     def __init__(self):
         super().__init__()
+        self.fusion_stats = {}
+        self.removed_functions = []
+        self.removed_size = 0
+        self.assembly = None
 
-    def translate(self, input_files, output_file):
-        writer = CodeWriter.CodeWriter(output_file)
-        writer.writeInit()
+    def translate(self, input_files, output_file, optimize=False,
+                  init=True, compact_calls=False, shared_comparisons=False,
+                  stack_caching=False, fuse=False, remove_unused=False,
+                  jobs=1):
+        """VMファイルをまとめて1つのアセンブリファイルに変換する．
 
-        for input_file in input_files:
-            self._translate(input_file, writer)
+        Args:
+            input_files (list): .vmファイルのリスト
+            output_file (string): 出力する.asmファイル．
+                Noneの場合はファイルに書かず，self.assemblyに残す
+            optimize (boolean): のぞき穴最適化を行うか
+            init (boolean): ブートストラップコードを書くか
+            compact_calls (boolean): call/returnを共有ルーチン経由で行うか
+            shared_comparisons (boolean): eq/gt/ltを共有ルーチン経由で行うか
+            stack_caching (boolean): スタックの先頭をDに保持するか
+            fuse (boolean): よく現れるコマンドの並びをまとめて変換するか
+            remove_unused (boolean): Sys.initから呼ばれない関数を取り除くか
+            jobs (int): ファイルごとに並列に変換するワーカー数．Noneの場合はCPU数
+
+        Returns:
+            int: ROMサイズ（命令数）
+        """
+        writer = CodeWriter.CodeWriter(output_file,
+                                       compact_calls=compact_calls,
+                                       shared_comparisons=shared_comparisons,
+                                       stack_caching=stack_caching)
+        if init:
+            writer.writeInit()
+
+        if remove_unused:
+            programs, removed = self._removeUnusedFunctions(
+                [(input_file, list(self._commands(Parser.Parser(input_file))))
+                 for input_file in input_files])
+            self._measureRemoved(removed, compact_calls, shared_comparisons,
+                                 stack_caching, fuse)
+        else:
+            programs = [(input_file, None) for input_file in input_files]
+
+        writer_options = {
+            'compact_calls': compact_calls,
+            'shared_comparisons': shared_comparisons,
+            'stack_caching': stack_caching
+        }
+        if jobs == 1 or len(programs) <= 1:
+            results = [_translateFile(input_file, commands, writer_options,
+                                      fuse)
+                       for input_file, commands in programs]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(_translateFile, input_file,
+                                           commands, writer_options, fuse)
+                           for input_file, commands in programs]
+                results = [future.result() for future in futures]
+
+        # 終わった順ではなく，入力ファイルの順につなげる
+        for codes, count, uses_shared_calls, used_comparisons, stats \
+                in results:
+            writer.writeTranslated(codes, count, uses_shared_calls,
+                                   used_comparisons)
+            for pattern, fired in stats.items():
+                self.fusion_stats[pattern] = \
+                    self.fusion_stats.get(pattern, 0) + fired
 
         writer.close()
+        if output_file is None:
+            self.assembly = writer.getText()
+
+        if optimize:
+            return self._optimize(output_file)
+        return writer.instruction_count
+
+    def _optimize(self, output_file):
+        if output_file is None:
+            lines = self.assembly.splitlines()
+        else:
+            with open(output_file) as f:
+                lines = f.readlines()
+        optimizer = PeepholeOptimizer.PeepholeOptimizer()
+        codes = optimizer.optimize(lines)
+        text = ''.join(code + '\n' for code in codes)
+        if output_file is None:
+            self.assembly = text
+        else:
+            with open(output_file, 'w') as f:
+                f.write(text)
+        return sum(1 for code in codes if not code.startswith('('))
+
+    def _removeUnusedFunctions(self, programs):
+        """Sys.initからの呼び出しグラフをたどり，呼ばれうる関数だけを残す．
+        Sys.initがない場合は何も取り除かない．
 
-    def _translate(self, input_file, writer):
-        parser = Parser.Parser(input_file)
+        Args:
+            programs (list): (.vmファイル, コマンドのリスト) のリスト
+
+        Returns:
+            tuple: (残す (.vmファイル, コマンドのリスト) のリスト,
+                取り除く (.vmファイル, コマンドのリスト) のリスト)
+        """
+        calls = {}
+        roots = ['Sys.init']
+        for _, commands in programs:
+            function_name = None
+            for command, arg1, _ in commands:
+                if command == Enums.Command.C_FUNCTION:
+                    function_name = arg1
+                    calls.setdefault(function_name, set())
+                elif command == Enums.Command.C_CALL:
+                    # 関数の外のコマンドは常に実行されうる
+                    if function_name is None:
+                        roots.append(arg1)
+                    else:
+                        calls[function_name].add(arg1)
+        if 'Sys.init' not in calls:
+            return programs, []
+
+        reachable = set()
+        while roots:
+            function_name = roots.pop()
+            if function_name not in reachable:
+                reachable.add(function_name)
+                roots.extend(calls.get(function_name, ()))
+
+        kept = []
+        removed = []
+        for input_file, commands in programs:
+            live = []
+            dead = []
+            is_live = True
+            for command in commands:
+                if command[0] == Enums.Command.C_FUNCTION:
+                    is_live = command[1] in reachable
+                (live if is_live else dead).append(command)
+            kept.append((input_file, live))
+            if dead:
+                removed.append((input_file, dead))
+        return kept, removed
+
+    def _measureRemoved(self, removed, compact_calls, shared_comparisons,
+                        stack_caching, fuse):
+        """取り除いた関数の名前と，それらを変換した場合の命令数を記録する．
+        """
+        writer = CodeWriter.CodeWriter(None,
+                                       compact_calls=compact_calls,
+                                       shared_comparisons=shared_comparisons,
+                                       stack_caching=stack_caching)
+        fuser = SuperInstructions.SuperInstructions() if fuse else None
+        for input_file, commands in removed:
+            self.removed_functions.extend(
+                arg1 for command, arg1, _ in commands
+                if command == Enums.Command.C_FUNCTION)
+            self._translate(input_file, commands, writer, fuser)
+        self.removed_size = writer.instruction_count
+
+    def _translate(self, input_file, commands, writer, fuser=None):
         writer.setFileName(input_file)
 
+        if fuser:
+            commands = fuser.fuse(commands)
+
+        handlers = self._handlers(writer)
+        for command in commands:
+            if isinstance(command, SuperInstructions.Fused):
+                getattr(writer, command.method)(*command.args)
+            else:
+                handlers[command[0]](command[1], command[2])
+
+        writer.endFile()
+
+    def _commands(self, parser):
+        """パーサーからコマンドを (コマンドの種類, 第1引数, 第2引数) の形で読み出す．
+
+        Args:
+            parser (Parser): .vmファイルのパーサー
+
+        Yields:
+            tuple: (コマンドの種類, 第1引数, 第2引数)
+        """
         while parser.hasMoreCommands():
             parser.advance()
+            yield parser.current_command
+
+    def _handlers(self, writer):
+        """コマンドの種類から，(第1引数, 第2引数) を受け取ってwriterに書く関数への表を作る．
+
+        Args:
+            writer (CodeWriter): 書き込み先
+
+        Returns:
+            dict: コマンドの種類から関数への辞書
+        """
+        return {
+            Enums.Command.C_ARITHMETIC:
+                lambda arg1, arg2: writer.writeArithmetic(arg1),
+            Enums.Command.C_PUSH:
+                lambda arg1, arg2: writer.writePushPop(
+                    Enums.Command.C_PUSH, arg1, arg2),
+            Enums.Command.C_POP:
+                lambda arg1, arg2: writer.writePushPop(
+                    Enums.Command.C_POP, arg1, arg2),
+            Enums.Command.C_LABEL: lambda arg1, arg2: writer.writeLabel(arg1),
+            Enums.Command.C_GOTO: lambda arg1, arg2: writer.writeGoto(arg1),
+            Enums.Command.C_IF: lambda arg1, arg2: writer.writeIf(arg1),
+            Enums.Command.C_CALL: writer.writeCall,
+            Enums.Command.C_RETURN: lambda arg1, arg2: writer.writeReturn(),
+            Enums.Command.C_FUNCTION: writer.writeFunction
+        }
 
-            command = parser.commandType()
-            if command == Enums.Command.C_ARITHMETIC:
-                writer.writeArithmetic(parser.arg1())
-            if command == Enums.Command.C_PUSH \
-                    or command == Enums.Command.C_POP:
-                writer.writePushPop(command, parser.arg1(), parser.arg2())
-            if command == Enums.Command.C_LABEL:
-                writer.writeLabel(parser.arg1())
-            if command == Enums.Command.C_GOTO:
-                writer.writeGoto(parser.arg1())
-            if command == Enums.Command.C_IF:
-                writer.writeIf(parser.arg1())
-            if command == Enums.Command.C_CALL:
-                writer.writeCall(parser.arg1(), parser.arg2())
-            if command == Enums.Command.C_RETURN:
-                writer.writeReturn()
-            if command == Enums.Command.C_FUNCTION:
-                writer.writeFunction(parser.arg1(), parser.arg2())
+
+def _translateFile(input_file, commands, writer_options, fuse):
+    """1つの.vmファイルを，他のファイルとは独立にメモリ上で変換する．
+    プロセスプールのワーカーで実行できるよう，結果は値だけで返す．
+
+    Args:
+        input_file (string): .vmファイル
+        commands (list): 変換するコマンド．Noneの場合はinput_fileを読む
+        writer_options (dict): CodeWriterに渡すオプション
+        fuse (boolean): よく現れるコマンドの並びをまとめて変換するか
+
+    Returns:
+        tuple: (アセンブリコード, 命令数, $CALL/$RETURNを使うか,
+            使った比較の共有ルーチン, パターンごとにまとめた回数)
+    """
+    translator = VMTranslator()
+    writer = CodeWriter.CodeWriter(None, **writer_options)
+    fuser = SuperInstructions.SuperInstructions() if fuse else None
+    if commands is None:
+        commands = translator._commands(Parser.Parser(input_file))
+    translator._translate(input_file, commands, writer, fuser)
+    return (writer.getText(), writer.instruction_count,
+            writer.uses_shared_calls, writer.used_comparisons,
+            fuser.stats if fuser else {})
 
 
 def _getInputFiles(input):
     input_files = [input] if input.endswith('.vm') \
-        else glob.glob(input + '/*.vm')
+        else sorted(glob.glob(input + '/*.vm'))
     if len(input_files) == 0:
         print('Directory does not contain .vm files')
     return input_files
@@ -58,10 +262,52 @@ def _getOutputFile(output_file):
     return output_file
 
 
-if len(sys.argv) != 3:
-    print("Invalid usage")
-    sys.exit(1)
-input_files = _getInputFiles(sys.argv[1])
-output_file = _getOutputFile(sys.argv[2])
-translator = VMTranslator()
-translator.translate(input_files, output_file)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='VM translator')
+    parser.add_argument('input', help='.vm file or directory')
+    parser.add_argument('output', help='output .asm file')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='run the peephole optimizer on the output')
+    parser.add_argument('--no-init', action='store_true',
+                        help='do not write the bootstrap code')
+    parser.add_argument('--compact-calls', action='store_true',
+                        help='share one call/return routine between sites')
+    parser.add_argument('--shared-comparisons', action='store_true',
+                        help='share one routine per eq/gt/lt comparison')
+    parser.add_argument('--stack-cache', action='store_true',
+                        help='keep the top of the stack in D between commands')
+    parser.add_argument('--fuse', action='store_true',
+                        help='translate common command sequences together')
+    parser.add_argument('--remove-unused', action='store_true',
+                        help='drop functions not reachable from Sys.init')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    parser.add_argument('--stats', action='store_true',
+                        help='print translation statistics')
+    args = parser.parse_args(argv)
+
+    input_files = _getInputFiles(args.input)
+    output_file = _getOutputFile(args.output)
+    translator = VMTranslator()
+    rom_size = translator.translate(input_files, output_file,
+                                    optimize=args.optimize,
+                                    init=not args.no_init,
+                                    compact_calls=args.compact_calls,
+                                    shared_comparisons=args.shared_comparisons,
+                                    stack_caching=args.stack_cache,
+                                    fuse=args.fuse,
+                                    remove_unused=args.remove_unused,
+                                    jobs=args.jobs)
+    if args.remove_unused:
+        for function_name in translator.removed_functions:
+            print('removed %s' % function_name)
+        print('removed %d functions, ROM saved: %d' % (
+            len(translator.removed_functions), translator.removed_size))
+    if args.stats:
+        for pattern, count in sorted(translator.fusion_stats.items()):
+            print('%s: %d' % (pattern, count))
+        print('ROM size: %d' % rom_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,28 +2,44 @@ from enum import Enum
 from enums import Enums
 import SymbolTable
 import VMWriter
+import XMLWriter
 
 
 class CompilationEngine:
 
-    def __init__(self, input_file, tokenizer):
-        self.indent_level = 0
+    def __init__(self, input_file, tokenizer, xml_writer=None):
+        """.jackファイルをコンパイルし，同じ名前の.vmファイルに書き出す．
+        .vmファイルはコンパイルに成功した場合にだけ書く．失敗した場合は，
+        途中までの.xmlファイルを削除して例外をそのまま送出する．
+
+        Args:
+            input_file (string): .jackファイル
+            tokenizer (JackTokenizer): input_fileのトークナイザ
+            xml_writer (XMLWriter): 構文木の出力先．コンパイル後に閉じる．
+                Noneの場合は構文木を出力しない
+        """
         self.tokenizer = tokenizer
         self.symbol_table = SymbolTable.SymbolTable()
         self.label_count = 0
 
         self.vm_output_path = input_file.replace('.jack', '.vm')
-        self.writer = VMWriter.VMWriter(self.vm_output_path, 'w')
-        self.xml_output = open(input_file.replace(
-            '.jack', '.xml'), 'w')
-
-        self.compileClass()
-        self.xml_output.close()
+        self.writer = VMWriter.VMWriter(None)
+        self.xml_writer = XMLWriter.NullXMLWriter() if xml_writer is None \
+            else xml_writer
+
+        try:
+            self.compileClass()
+        except Exception:
+            self.xml_writer.discard()
+            raise
+        self.xml_writer.close()
+        with open(self.vm_output_path, 'w') as f:
+            f.write(self.writer.getText())
 
     def compileClass(self):
         """クラスをコンパイルする．
         """
-        self._writeElementStart(TagName.CLASS)
+        self.xml_writer.writeElementStart(TagName.CLASS)
 
         self.compileKeyword()
 
@@ -42,26 +58,27 @@ class CompilationEngine:
             self.compileSubroutine()
         self.compileSymbol()
 
-        self._writeElementEnd(TagName.CLASS)
+        self.xml_writer.writeElementEnd(TagName.CLASS)
 
     def compileKeyword(self):
         """キーワードをコンパイルする．
         """
-        self._writeElement(TagName.KEYWORD, self.tokenizer.keyword().value)
+        self.xml_writer.writeElement(TagName.KEYWORD,
+                                     self.tokenizer.keyword().value)
 
         if self.tokenizer.hasMoreTokens():
             self.tokenizer.advance()
 
     def compileSymbol(self):
         symbol = self.tokenizer.symbol()
-        if self.tokenizer.symbol() is Enums.Symbol.LESS_THAN_SIGN:
-            self._writeElement(TagName.SYMBOL, '&lt;')
-        elif self.tokenizer.symbol() is Enums.Symbol.GREATER_THAN_SIGN:
-            self._writeElement(TagName.SYMBOL, '&gt;')
-        elif self.tokenizer.symbol() is Enums.Symbol.AMPERSAND:
-            self._writeElement(TagName.SYMBOL, '&amp;')
+        if symbol is Enums.Symbol.LESS_THAN_SIGN:
+            self.xml_writer.writeElement(TagName.SYMBOL, '&lt;')
+        elif symbol is Enums.Symbol.GREATER_THAN_SIGN:
+            self.xml_writer.writeElement(TagName.SYMBOL, '&gt;')
+        elif symbol is Enums.Symbol.AMPERSAND:
+            self.xml_writer.writeElement(TagName.SYMBOL, '&amp;')
         else:
-            self._writeElement(TagName.SYMBOL, symbol.value)
+            self.xml_writer.writeElement(TagName.SYMBOL, symbol.value)
 
         if self.tokenizer.hasMoreTokens():
             self.tokenizer.advance()
@@ -69,8 +86,8 @@ class CompilationEngine:
     def compileIdentifier(self):
         """識別子（identifier）をコンパイルする．
         """
-        self._writeElement(TagName.IDENTIFIER,
-                           self.tokenizer.identifier())
+        self.xml_writer.writeElement(TagName.IDENTIFIER,
+                                     self.tokenizer.identifier())
 
         if self.tokenizer.hasMoreTokens():
             self.tokenizer.advance()
@@ -78,8 +95,8 @@ class CompilationEngine:
     def compileIntegerConstant(self):
         """整数の定数をコンパイルする．
         """
-        self._writeElement(TagName.INTEGER_CONSTANT,
-                           self.tokenizer.intVal())
+        self.xml_writer.writeElement(TagName.INTEGER_CONSTANT,
+                                     self.tokenizer.intVal())
 
         if self.tokenizer.hasMoreTokens():
             self.tokenizer.advance()
@@ -88,7 +105,7 @@ class CompilationEngine:
         """文字列の定数をコンパイルする．
         """
         string_val = self.tokenizer.stringVal()
-        self._writeElement(TagName.STRING_CONSTANT, string_val)
+        self.xml_writer.writeElement(TagName.STRING_CONSTANT, string_val)
         self.writer.writePush(Enums.Segment.CONST, len(string_val))
         self.writer.writeCall('String.new', 1)
 
@@ -118,7 +135,7 @@ class CompilationEngine:
     def compileClassVarDec(self):
         """スタティック宣言またはフィールド宣言をコンパイルする．
         """
-        self._writeElementStart(TagName.CLASS_VAR_DEC)
+        self.xml_writer.writeElementStart(TagName.CLASS_VAR_DEC)
 
         kind = Enums.Kind(self.tokenizer.keyword().value)
         self.compileKeyword()
@@ -132,14 +149,14 @@ class CompilationEngine:
                 type, kind, declaration=True)
         self.compileSymbol()
 
-        self._writeElementEnd(TagName.CLASS_VAR_DEC)
+        self.xml_writer.writeElementEnd(TagName.CLASS_VAR_DEC)
 
     def compileSubroutine(self):
         """メソッド，ファンクション，コンストラクタをコンパイルする．
         """
         self.symbol_table.startSubroutine()
 
-        self._writeElementStart(TagName.SUBROUTINE_DEC)
+        self.xml_writer.writeElementStart(TagName.SUBROUTINE_DEC)
 
         subroutine_keyword = self.tokenizer.keyword()
         if subroutine_keyword is Enums.Keyword.METHOD:
@@ -161,10 +178,17 @@ class CompilationEngine:
         self.compileSymbol()
 
         # Body
-        self._writeElementStart(TagName.SUBROUTINE_BODY)
+        self.xml_writer.writeElementStart(TagName.SUBROUTINE_BODY)
         self.compileSymbol()  # {
 
-        self.writer.writeFunction(function_name, 0)
+        # ローカル変数の宣言はVMコードを出力しないので，数え終えてから関数を書き始める
+        n_locals = 0
+        while self.tokenizer.tokenType() is Enums.Token.KEYWORD \
+                and self.tokenizer.keyword() is Enums.Keyword.VAR:
+            n_var = self.compileVarDec()
+            n_locals += n_var
+
+        self.writer.writeFunction(function_name, n_locals)
         if subroutine_keyword is Enums.Keyword.CONSTRUCTOR:
             self.writer.writePush(Enums.Segment.CONST,
                                   self.symbol_table.varCount(Enums.Kind.FIELD))
@@ -174,36 +198,17 @@ class CompilationEngine:
             self.writer.writePush(Enums.Segment.ARGUMENT, 0)
             self.writer.writePop(Enums.Segment.POINTER, 0)
 
-        n_locals = 0
-        while self.tokenizer.tokenType() is Enums.Token.KEYWORD \
-                and self.tokenizer.keyword() is Enums.Keyword.VAR:
-            n_var = self.compileVarDec()
-            n_locals += n_var
-
-        if n_locals:
-            self.writer.close()
-            f = open(self.vm_output_path, 'r')
-            new_lines = f.read().replace('%s 0' % function_name, '%s %d' %
-                                         (function_name, n_locals))
-            f.close()
-
-            f = open(self.vm_output_path, 'w')
-            f.write(new_lines)
-            f.close()
-
-            self.writer = VMWriter.VMWriter(self.vm_output_path, 'a')
-
         self.compileStatements()
         self.compileSymbol()
 
-        self._writeElementEnd(TagName.SUBROUTINE_BODY)
+        self.xml_writer.writeElementEnd(TagName.SUBROUTINE_BODY)
 
-        self._writeElementEnd(TagName.SUBROUTINE_DEC)
+        self.xml_writer.writeElementEnd(TagName.SUBROUTINE_DEC)
 
     def compileParameterList(self):
         """パラメータのリスト（空の可能性もある）をコンパイルする．"()" は含まない．
         """
-        self._writeElementStart(TagName.PARAMETER_LIST)
+        self.xml_writer.writeElementStart(TagName.PARAMETER_LIST)
 
         if (self.tokenizer.tokenType() is Enums.Token.KEYWORD
             and self.tokenizer.keyword() in (
@@ -220,12 +225,12 @@ class CompilationEngine:
                 self.compileVarName(
                     type, Enums.Kind.ARGUMENT, declaration=True)
 
-        self._writeElementEnd(TagName.PARAMETER_LIST)
+        self.xml_writer.writeElementEnd(TagName.PARAMETER_LIST)
 
     def compileVarDec(self):
         """var宣言をコンパイルする．
         """
-        self._writeElementStart(TagName.VAR_DEC)
+        self.xml_writer.writeElementStart(TagName.VAR_DEC)
 
         self.compileKeyword()  # var
         type = self.compileType()
@@ -239,7 +244,7 @@ class CompilationEngine:
             self.compileVarName(type, Enums.Kind.VAR, declaration=True)
         self.compileSymbol()
 
-        self._writeElementEnd(TagName.VAR_DEC)
+        self.xml_writer.writeElementEnd(TagName.VAR_DEC)
         return n_var
 
     def compileVarName(self, type=None, kind=None, declaration=False, let=False, call=False):
@@ -266,13 +271,14 @@ class CompilationEngine:
             index = self.symbol_table.indexOf(name)
             self.writer.writePush(segment, index)
 
-        self._writeIdentifier(name, declaration)
+        self.xml_writer.writeIdentifier(name, declaration,
+                                        self.symbol_table)
         self.tokenizer.advance()
 
     def compileStatements(self):
         """一連の文ををコンパイルする．"{}" は含まない．
         """
-        self._writeElementStart(TagName.STATEMENTS)
+        self.xml_writer.writeElementStart(TagName.STATEMENTS)
 
         while self.tokenizer.tokenType() is Enums.Token.KEYWORD \
             and self.tokenizer.keyword() in \
@@ -290,7 +296,7 @@ class CompilationEngine:
             elif self.tokenizer.keyword() is Enums.Keyword.RETURN:
                 self.compileReturn()
 
-        self._writeElementEnd(TagName.STATEMENTS)
+        self.xml_writer.writeElementEnd(TagName.STATEMENTS)
 
     def compileSubroutineCall(self):
         name = self.tokenizer.identifier()
@@ -335,19 +341,19 @@ class CompilationEngine:
     def compileDo(self):
         """do文をコンパイルする．
         """
-        self._writeElementStart(TagName.DO_STATEMENT)
+        self.xml_writer.writeElementStart(TagName.DO_STATEMENT)
 
         self.compileKeyword()  # do
         self.compileSubroutineCall()
         self.compileSymbol()  # ;
 
         self.writer.writePop(Enums.Segment.TEMP, 0)
-        self._writeElementEnd(TagName.DO_STATEMENT)
+        self.xml_writer.writeElementEnd(TagName.DO_STATEMENT)
 
     def compileLet(self):
         """let文をコンパイルする．
         """
-        self._writeElementStart(TagName.LET_STATEMENT)
+        self.xml_writer.writeElementStart(TagName.LET_STATEMENT)
 
         self.compileKeyword()
         name = self.tokenizer.identifier()
@@ -391,12 +397,12 @@ class CompilationEngine:
 
         self.compileSymbol()
 
-        self._writeElementEnd(TagName.LET_STATEMENT)
+        self.xml_writer.writeElementEnd(TagName.LET_STATEMENT)
 
     def compileWhile(self):
         """while文をコンパイルする．
         """
-        self._writeElementStart(TagName.WHILE_STATEMENT)
+        self.xml_writer.writeElementStart(TagName.WHILE_STATEMENT)
 
         label_loop = 'WHILE_LOOP_%d' % self.label_count
         label_end = 'WHILE_END_%d' % self.label_count
@@ -415,12 +421,12 @@ class CompilationEngine:
         self.writer.writeGoto(label_loop)
         self.writer.writeLabel(label_end)
 
-        self._writeElementEnd(TagName.WHILE_STATEMENT)
+        self.xml_writer.writeElementEnd(TagName.WHILE_STATEMENT)
 
     def compileReturn(self):
         """return文をコンパイルする．
         """
-        self._writeElementStart(TagName.RETURN_STATEMENT)
+        self.xml_writer.writeElementStart(TagName.RETURN_STATEMENT)
 
         self.compileKeyword()  # return
         if self.tokenizer.tokenType() is not Enums.Token.SYMBOL \
@@ -432,12 +438,12 @@ class CompilationEngine:
         self.compileSymbol()  # ;
 
         self.writer.writeReturn()
-        self._writeElementEnd(TagName.RETURN_STATEMENT)
+        self.xml_writer.writeElementEnd(TagName.RETURN_STATEMENT)
 
     def compileIf(self):
         """if文をコンパイルする．else文を扱う可能性がある．
         """
-        self._writeElementStart(TagName.IF_STATEMENT)
+        self.xml_writer.writeElementStart(TagName.IF_STATEMENT)
 
         label_else = 'IF_ELSE_%d' % self.label_count
         label_end = 'IF_END_%d' % self.label_count
@@ -463,12 +469,12 @@ class CompilationEngine:
             self.compileSymbol()  # }
         self.writer.writeLabel(label_end)
 
-        self._writeElementEnd(TagName.IF_STATEMENT)
+        self.xml_writer.writeElementEnd(TagName.IF_STATEMENT)
 
     def compileExpression(self):
         """式をコンパイルする．
         """
-        self._writeElementStart(TagName.EXPRESSION)
+        self.xml_writer.writeElementStart(TagName.EXPRESSION)
 
         self.compileTerm()
         while self.tokenizer.tokenType() is Enums.Token.SYMBOL \
@@ -505,7 +511,7 @@ class CompilationEngine:
             elif symbol is Enums.Symbol.EQUAL:
                 self.writer.writeArithmetic(Enums.Command.EQ)
 
-        self._writeElementEnd(TagName.EXPRESSION)
+        self.xml_writer.writeElementEnd(TagName.EXPRESSION)
 
     def compileTerm(self):
         """termをコンパイルする．
@@ -517,7 +523,7 @@ class CompilationEngine:
 
         他のトークンの場合は現トークンに含まないので先読みを行う必要はない．
         """
-        self._writeElementStart(TagName.TERM)
+        self.xml_writer.writeElementStart(TagName.TERM)
 
         if self.tokenizer.tokenType() is Enums.Token.INT_CONST:
             self.writer.writePush(Enums.Segment.CONST, self.tokenizer.intVal())
@@ -591,12 +597,12 @@ class CompilationEngine:
             if symbol is Enums.Symbol.TILDE:
                 self.writer.writeArithmetic(Enums.Command.NOT)
 
-        self._writeElementEnd(TagName.TERM)
+        self.xml_writer.writeElementEnd(TagName.TERM)
 
     def compileExpressionList(self):
         """コンマで分離された式のリスト（空の可能性もある）をコンパイルする．
         """
-        self._writeElementStart(TagName.EXPRESSION_LIST)
+        self.xml_writer.writeElementStart(TagName.EXPRESSION_LIST)
 
         n_args = 0
         if self.tokenizer.tokenType() is not Enums.Token.SYMBOL \
@@ -611,51 +617,9 @@ class CompilationEngine:
                 self.compileExpression()
                 n_args += 1
 
-        self._writeElementEnd(TagName.EXPRESSION_LIST)
+        self.xml_writer.writeElementEnd(TagName.EXPRESSION_LIST)
         return n_args
 
-    def _writeElement(self, tag_name, value):
-        """要素を書き出す．
-
-        Args:
-            tag_name (TagName): タグ名
-            value (string): 値
-        """
-        indent = '  ' * self.indent_level
-        self.xml_output.write('%s<%s> %s </%s>\n' %
-                              (indent, tag_name.value, value, tag_name.value))
-
-    def _writeElementStart(self, tag_name):
-        """開始要素を書き出す．
-
-        Args:
-            tag_name (TagName): タグ名
-        """
-        indent = '  ' * self.indent_level
-        self.xml_output.write('%s<%s>\n' % (indent, tag_name.value))
-        self.indent_level += 1
-
-    def _writeElementEnd(self, tag_name):
-        """終了要素を書き出す．
-
-        Args:
-            tag_name (TagName): タグ名
-        """
-        self.indent_level -= 1
-        indent = '  ' * self.indent_level
-        self.xml_output.write('%s</%s>\n' % (indent, tag_name.value))
-
-    def _writeIdentifier(self, name, declaration):
-        type = self.symbol_table.typeOf(name)
-        kind = self.symbol_table.kindOf(name)
-        index = self.symbol_table.indexOf(name)
-        info = 'declaration: %s, type: %s, kind: %s, index: %s' % (
-            declaration, type, kind, index)
-
-        indent = '  ' * self.indent_level
-        self.xml_output.write('%s<identifier> %s </identifier> %s\n' %
-                              (indent, name, info))
-
 
 class TagName(Enum):
     KEYWORD = 'keyword'
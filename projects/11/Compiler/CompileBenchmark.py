@@ -0,0 +1,65 @@
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+import JackAnalyzer
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+DEFAULT_INPUTS = sorted(
+    glob.glob(os.path.join(PROJECTS, '11', '*', '*.jack')) +
+    glob.glob(os.path.join(PROJECTS, '12', '*.jack')))
+
+
+def measure(input_files, xml, repeat):
+    """.jackファイルを一時ディレクトリにコピーしてコンパイルし，かかった時間を測る．
+
+    Args:
+        input_files (list): .jackファイルのリスト
+        xml (boolean): 構文木を.xmlファイルにも書き出すか
+        repeat (int): 計測回数．最も速かった回を採る
+
+    Returns:
+        float: コンパイルにかかった秒数
+    """
+    work = tempfile.mkdtemp()
+    try:
+        # 同じ名前のファイルがあるので，元のディレクトリごとに分けてコピーする
+        files = []
+        for input_file in input_files:
+            directory = os.path.join(
+                work, os.path.basename(os.path.dirname(input_file)))
+            os.makedirs(directory, exist_ok=True)
+            files.append(shutil.copy(input_file, directory))
+
+        analyzer = JackAnalyzer.JackAnalyzer()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            analyzer.analyze(files, xml=xml)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+    finally:
+        shutil.rmtree(work)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure end-to-end compile time with and without XML')
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS,
+                        help='.jack files (default: projects/11 and 12)')
+    parser.add_argument('-n', '--repeat', type=int, default=10,
+                        help='number of runs; the fastest one is reported')
+    args = parser.parse_args(argv)
+
+    print('%d files' % len(args.inputs))
+    for label, xml in (('vm only', False), ('vm + xml', True)):
+        print('%-10s %8.1f ms' % (
+            label, measure(args.inputs, xml, args.repeat) * 1000))
+
+
+if __name__ == '__main__':
+    main()
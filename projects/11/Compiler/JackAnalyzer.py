@@ -1,7 +1,12 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import CompilationEngine
 import glob
 import JackTokenizer
+import os
 import sys
+import time
+import XMLWriter
 
 
 class JackAnalyzer:
@@ -9,15 +14,65 @@ class JackAnalyzer:
     def __init__(self):
         super().__init__()
 
-    def analyze(self, input_files):
-        for input_file in input_files:
-            CompilationEngine.CompilationEngine(
-                input_file, JackTokenizer.JackTokenizer(input_file))
+    def analyze(self, input_files, xml=False, jobs=1):
+        """.jackファイルをそれぞれ.vmファイルにコンパイルする．
+        クラスは.vmファイル単位で独立しているので，ファイルごとに並列にコンパイルできる．
+        あるファイルでエラーが起きても，残りのファイルのコンパイルは続ける．
 
+        Args:
+            input_files (list): .jackファイルのリスト
+            xml (boolean): 構文木を.xmlファイルにも書き出すか
+            jobs (int): ファイルごとに並列にコンパイルするワーカー数．Noneの場合はCPU数
 
-def _getInputFiles(input):
-    input_files = [input] if input.endswith('.jack') \
-        else glob.glob(input + '/*.jack')
+        Returns:
+            dict: .jackファイルから (かかった秒数, エラーメッセージ) への辞書．
+                成功した場合のエラーメッセージはNone
+        """
+        if jobs == 1 or len(input_files) <= 1:
+            return {input_file: _compileFile(input_file, xml)
+                    for input_file in input_files}
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_compileFile, input_file, xml)
+                       for input_file in input_files]
+            return {input_file: future.result()
+                    for input_file, future in zip(input_files, futures)}
+
+
+def _compileFile(input_file, xml):
+    """1つの.jackファイルをコンパイルし，エラーは例外ではなく値として返す．
+    失敗した場合，そのクラスの.vmファイルと.xmlファイルは残さない．
+
+    Args:
+        input_file (string): .jackファイル
+        xml (boolean): 構文木を.xmlファイルにも書き出すか
+
+    Returns:
+        tuple: (かかった秒数, エラーメッセージ．成功した場合はNone)
+    """
+    start = time.perf_counter()
+    try:
+        tokenizer = JackTokenizer.JackTokenizer(input_file)
+        xml_writer = XMLWriter.XMLWriter(
+            input_file.replace('.jack', '.xml')) if xml else None
+        CompilationEngine.CompilationEngine(input_file, tokenizer, xml_writer)
+    except Exception as e:
+        # 前回のコンパイル結果が残っていると，失敗したクラスのまま変換されてしまう
+        vm_file = input_file.replace('.jack', '.vm')
+        if os.path.exists(vm_file):
+            os.remove(vm_file)
+        return time.perf_counter() - start, str(e) or type(e).__name__
+    return time.perf_counter() - start, None
+
+
+def _getInputFiles(inputs):
+    input_files = []
+    for input in inputs:
+        if input.endswith('.jack'):
+            input_files.append(input)
+        else:
+            input_files.extend(sorted(glob.glob(os.path.join(input,
+                                                             '*.jack'))))
     if len(input_files) == 0:
         print('Directory does not contain .jack files')
     return input_files
@@ -27,9 +82,34 @@ def _getOutputFile(output_file):
     return output_file
 
 
-if len(sys.argv) != 2:
-    print("Invalid usage")
-    sys.exit(1)
-input_files = _getInputFiles(sys.argv[1])
-analyzer = JackAnalyzer()
-analyzer.analyze(input_files)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Jack compiler')
+    parser.add_argument('inputs', nargs='+',
+                        help='.jack files or directories')
+    parser.add_argument('--xml', action='store_true',
+                        help='also write the parse tree to .xml files')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    args = parser.parse_args(argv)
+
+    input_files = _getInputFiles(args.inputs)
+    analyzer = JackAnalyzer()
+    start = time.perf_counter()
+    results = analyzer.analyze(input_files, xml=args.xml, jobs=args.jobs)
+    elapsed = time.perf_counter() - start
+
+    failed = [input_file for input_file, (_, error) in results.items()
+              if error is not None]
+    if len(input_files) > 1:
+        for input_file, (seconds, error) in results.items():
+            print('%s: %s' % (input_file, '%.3fs' % seconds if error is None
+                              else 'failed: %s' % error))
+        print('%d files in %.3fs' % (len(input_files), elapsed))
+    elif failed:
+        print('%s: failed: %s' % (failed[0], results[failed[0]][1]))
+    if failed or not input_files:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,44 @@ from collections import deque
 from enums import Enums
 import re
 
+# トークンの文字列からEnumへの表
+_KEYWORDS = {keyword.value: keyword for keyword in Enums.Keyword}
+_SYMBOLS = {symbol.value: symbol for symbol in Enums.Symbol}
+
+# 1つの正規表現でファイル全体を先頭から順に読む．
+# 空白とコメントはspace，どれにも当てはまらない1文字はerrorになる
+_TOKEN_REGEX = re.compile(r'''
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<string>"[^"\n]*")
+  | (?P<int>[0-9]+)
+  | (?P<word>[a-zA-Z_][a-zA-Z0-9_]*)
+  | (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+  | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+
+# 整数定数の最大値
+_MAX_INT = 32767
+
+
+class Token:
+    __slots__ = ('kind', 'value', 'text', 'line', 'column')
+
+    def __init__(self, kind, value, text, line, column):
+        """ソース上の位置を持つ1つのトークン．
+
+        Args:
+            kind (Token): トークンの種類
+            value: トークンの値（Keyword, Symbol, int，識別子または文字列）
+            text (string): ソース上のトークンの文字列
+            line (int): 行番号
+            column (int): 列番号
+        """
+        self.kind = kind
+        self.value = value
+        self.text = text
+        self.line = line
+        self.column = column
+
 
 class JackTokenizer:
 
@@ -11,89 +49,52 @@ class JackTokenizer:
         Args:
             input_file (string): ファイルパス
         """
-        self.tokens = deque([])
-        for line in self._deleteCommentsAndEmptyLines(input_file):
-            while line:
-                double_quote_index = line.find('"')
-                space_index = line.find(' ')
-                if line.startswith('"'):
-                    index = line.find('"', 1)
-                    self.tokens.append(line[0:index+1])
-                    line = line[index+1:].strip()
-                elif double_quote_index != -1 and space_index != 1 \
-                        and double_quote_index < space_index:
-                    self.tokens.extend(self._tokenize(
-                        line[0:double_quote_index]))
-                    line = line[double_quote_index:].strip()
-                elif space_index != -1:
-                    self.tokens.extend(self._tokenize(line[0:space_index]))
-                    line = line[space_index:].strip()
-                else:
-                    self.tokens.extend(self._tokenize(line))
-                    line = ''
+        self.input_file = input_file
+        with open(input_file, 'r') as f:
+            self.tokens = deque(self._tokenize(f.read()))
 
-        self.current_token = ''
+        self.current_token = None
         self.advance()
 
-    def _deleteCommentsAndEmptyLines(self, input_file):
-        """コメントや空文字など不要なものを削除する．
+    def _tokenize(self, source):
+        """ソース全体を1回だけ走査し，コメントと空白を除いたトークンを順に返す．
 
         Args:
-            input_file (File): ファイル
+            source (string): ファイルの内容
 
-        Returns:
-            list: コメントや空文字削除済みの文字列のリスト
+        Yields:
+            Token: トークン
         """
-        _input_file = open(input_file, 'r')
-        # 1行コメントのみ，空文字の行は無視
-        # コード内の1行コメントはコメントを削除
-        _lines = [line.split("//")[0].strip()
-                  for line in _input_file.readlines()
-                  if line.split("//")[0].strip()]
-        _input_file.close()
-
-        # 複数行コメントの削除
-        __lines = []
-        multi_line_comment_flag = False
-        multi_line_comment_start_pattern = re.compile(r'.*\/\*')
-        multi_line_comment_end_pattern = re.compile(r'.*\*\/')
-        for line in _lines:
-            if multi_line_comment_start_pattern.match(line):
-                multi_line_comment_flag = True
-            if multi_line_comment_end_pattern.match(line):
-                multi_line_comment_flag = False
+        line = 1
+        line_start = 0
+        for match in _TOKEN_REGEX.finditer(source):
+            group = match.lastgroup
+            text = match.group()
+            if group == 'space':
+                newlines = text.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = match.start() + text.rfind('\n') + 1
                 continue
-            if not multi_line_comment_flag:
-                __lines.append(line)
-
-        return __lines
 
-    tokenizer_regex = re.compile(r'[\{\}\(\)\[\]\.,;\+\-\*\/&\|<>=~]')
-
-    def _tokenize(self, s):
-        """入力された文字列のトークン化を行う．
-
-        Args:
-            s (string): トークン化対象の文字列
-
-        Returns:
-            list: トークンのリスト
-        """
-        tokens = []
-        while s:
-            if JackTokenizer.tokenizer_regex.search(s):
-                index = JackTokenizer.tokenizer_regex.search(s).start()
-
-                if index != 0:
-                    tokens.append(s[0:index])
-
-                tokens.append(s[index:index+1])
-                s = s[index+1:]
+            # 種類と値はここで一度だけ決める
+            column = match.start() - line_start + 1
+            if group == 'word':
+                value = _KEYWORDS.get(text)
+                if value is None:
+                    kind, value = Enums.Token.IDENTIFIER, text
+                else:
+                    kind = Enums.Token.KEYWORD
+            elif group == 'symbol':
+                kind, value = Enums.Token.SYMBOL, _SYMBOLS[text]
+            elif group == 'int' and int(text) <= _MAX_INT:
+                kind, value = Enums.Token.INT_CONST, int(text)
+            elif group == 'string':
+                kind, value = Enums.Token.STRING_CONST, text[1:-1]
             else:
-                tokens.append(s)
-                s = ''
-
-        return tokens
+                raise Exception('Invalid token: %s at %s:%d:%d' % (
+                    text, self.input_file, line, column))
+            yield Token(kind, value, text, line, column)
 
     def hasMoreTokens(self):
         """入力にまだトークンは存在するか？
@@ -107,29 +108,13 @@ class JackTokenizer:
         """
         self.current_token = self.tokens.popleft()
 
-    int_const_regex = re.compile(r'[0-9]+$')
-    identifier_regex = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
-    string_regex = re.compile(r'^"[^"\n]*"$')
-
     def tokenType(self):
         """現トークンの種類を返す．
 
         Returns:
             Token: 現在のトークン
         """
-        if self.current_token in [keyword.value for keyword in Enums.Keyword]:
-            return Enums.Token.KEYWORD
-        elif self.current_token in [symbol.value for symbol in Enums.Symbol]:
-            return Enums.Token.SYMBOL
-        elif JackTokenizer.int_const_regex.match(self.current_token) \
-                and int(self.current_token) <= 32627:
-            return Enums.Token.INT_CONST
-        elif JackTokenizer.identifier_regex.match(self.current_token):
-            return Enums.Token.IDENTIFIER
-        elif JackTokenizer.string_regex.match(self.current_token):
-            return Enums.Token.STRING_CONST
-
-        raise Exception('Invalid token: %s' % self.current_token)
+        return self.current_token.kind
 
     def keyword(self):
         """現トークンのキーワードを返す．このルーチンはtokenType()がKEYWORDの場合のみ呼び出すことができる．
@@ -137,10 +122,10 @@ class JackTokenizer:
         Returns:
             Keyword: 現トークンのキーワード
         """
-        if self.tokenType() is not Enums.Token.KEYWORD:
+        if self.current_token.kind is not Enums.Token.KEYWORD:
             raise Exception('Invalid usage at keyword: %s' %
-                            self.current_token)
-        return Enums.Keyword(self.current_token)
+                            self.current_token.text)
+        return self.current_token.value
 
     def symbol(self):
         """現トークンの文字を返す，このルーチンはtokenType()がSYMBOLの場合のみ呼び出すことができる．
@@ -148,9 +133,10 @@ class JackTokenizer:
         Returns:
             string: 現トークンの文字
         """
-        if self.tokenType() is not Enums.Token.SYMBOL:
-            raise Exception('Invalid usage at symbol: %s' % self.current_token)
-        return Enums.Symbol(self.current_token)
+        if self.current_token.kind is not Enums.Token.SYMBOL:
+            raise Exception('Invalid usage at symbol: %s' %
+                            self.current_token.text)
+        return self.current_token.value
 
     def identifier(self):
         """現トークンの識別子（identifier）を返す，このルーチンはtokenType()がIDENTIFIERの場合のみ呼び出すことができる．
@@ -158,10 +144,10 @@ class JackTokenizer:
         Returns:
             string: 現トークンの識別子
         """
-        if self.tokenType() is not Enums.Token.IDENTIFIER:
+        if self.current_token.kind is not Enums.Token.IDENTIFIER:
             raise Exception('Invalid usage at identifier: %s' %
-                            self.current_token)
-        return self.current_token
+                            self.current_token.text)
+        return self.current_token.value
 
     def intVal(self):
         """現トークンの整数の値を返す，このルーチンはtokenType()がINT_CONSTの場合のみ呼び出すことができる．
@@ -169,9 +155,10 @@ class JackTokenizer:
         Returns:
             int: 現トークンの整数の値
         """
-        if self.tokenType() is not Enums.Token.INT_CONST:
-            raise Exception('Invalid usage at intVal: %s' % self.current_token)
-        return int(self.current_token)
+        if self.current_token.kind is not Enums.Token.INT_CONST:
+            raise Exception('Invalid usage at intVal: %s' %
+                            self.current_token.text)
+        return self.current_token.value
 
     def stringVal(self):
         """現トークンの文字列を返す，このルーチンはtokenType()がSTRING_CONSTの場合のみ呼び出すことができる．
@@ -179,7 +166,7 @@ class JackTokenizer:
         Returns:
             string: 現トークンの文字列
         """
-        if self.tokenType() is not Enums.Token.STRING_CONST:
+        if self.current_token.kind is not Enums.Token.STRING_CONST:
             raise Exception('Invalid usage at stringVal: %s' %
-                            self.current_token)
-        return self.current_token[1:-1]
+                            self.current_token.text)
+        return self.current_token.value
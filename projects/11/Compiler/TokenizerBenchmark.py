@@ -0,0 +1,56 @@
+import argparse
+import glob
+import os
+import time
+import JackTokenizer
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+DEFAULT_INPUTS = sorted(
+    glob.glob(os.path.join(PROJECTS, '11', '*', '*.jack')) +
+    glob.glob(os.path.join(PROJECTS, '12', '*.jack')) +
+    glob.glob(os.path.join(PROJECTS, '12', '*', '*.jack')))
+
+
+def measure(input_files, repeat):
+    """.jackファイルをトークン化し，1秒あたりのトークン数を測る．
+
+    Args:
+        input_files (list): .jackファイルのリスト
+        repeat (int): 計測回数．最も速かった回を採る
+
+    Returns:
+        tuple: (トークン数, 1秒あたりのトークン数)
+    """
+    tokens = 0
+    best = None
+    for _ in range(repeat):
+        tokens = 0
+        start = time.perf_counter()
+        for input_file in input_files:
+            tokenizer = JackTokenizer.JackTokenizer(input_file)
+            tokens += 1
+            while tokenizer.hasMoreTokens():
+                tokenizer.advance()
+                tokens += 1
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return tokens, tokens / best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure JackTokenizer tokens per second')
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS,
+                        help='.jack files (default: projects/11 and 12)')
+    parser.add_argument('-n', '--repeat', type=int, default=10,
+                        help='number of runs; the fastest one is reported')
+    args = parser.parse_args(argv)
+
+    tokens, rate = measure(args.inputs, args.repeat)
+    print('%d files, %d tokens, %.0f tokens/s' % (
+        len(args.inputs), tokens, rate))
+
+
+if __name__ == '__main__':
+    main()
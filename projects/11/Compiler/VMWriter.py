@@ -1,7 +1,22 @@
+import io
+
+# 出力をまとめて書き込むまでにためておくコマンド数
+_BUFFER_COMMANDS = 4096
+
+
 class VMWriter:
 
-    def __init__(self, output_file, mode):
-        self.file = open(output_file, mode)
+    def __init__(self, output_file, mode='w'):
+        """出力ファイルを開く．
+
+        Args:
+            output_file (string): 出力ファイル名．Noneの場合はメモリ上に書く
+            mode (string): ファイルを開くモード
+        """
+        self.file = io.StringIO() if output_file is None \
+            else open(output_file, mode)
+        self.in_memory = output_file is None
+        self._buffer = []
 
     def writePush(self, segment, index):
         """pushコマンドを書く．
@@ -10,7 +25,7 @@ class VMWriter:
             segment (Segment): セグメント（CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP）
             index (int): 整数
         """
-        self.file.write('push %s %d\n' % (segment.value, index))
+        self._write('push %s %d\n' % (segment.value, index))
 
     def writePop(self, segment, index):
         """popコマンドを書く．
@@ -19,7 +34,7 @@ class VMWriter:
             segment (Segment): セグメント（CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP）
             index (int): 整数
         """
-        self.file.write('pop %s %d\n' % (segment.value, index))
+        self._write('pop %s %d\n' % (segment.value, index))
 
     def writeArithmetic(self, command):
         """算術コマンドを書く．
@@ -27,7 +42,7 @@ class VMWriter:
         Args:
             command ([type]): 算術コマンド（ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT）
         """
-        self.file.write('%s\n' % command.value)
+        self._write('%s\n' % command.value)
 
     def writeLabel(self, label):
         """labelコマンドを書く．
@@ -35,7 +50,7 @@ class VMWriter:
         Args:
             label (string): label
         """
-        self.file.write('label %s\n' % label)
+        self._write('label %s\n' % label)
 
     def writeGoto(self, label):
         """gotoコマンドを書く．
@@ -43,7 +58,7 @@ class VMWriter:
         Args:
             label (string): label
         """
-        self.file.write('goto %s\n' % label)
+        self._write('goto %s\n' % label)
 
     def writeIf(self, label):
         """if-gotoコマンドを書く．
@@ -51,7 +66,7 @@ class VMWriter:
         Args:
             label (string): label
         """
-        self.file.write('if-goto %s\n' % label)
+        self._write('if-goto %s\n' % label)
 
     def writeCall(self, name, nArgs):
         """callコマンドを書く．
@@ -60,7 +75,7 @@ class VMWriter:
             name (string): 関数名
             nArgs (int): 引数の数
         """
-        self.file.write('call %s %d\n' % (name, nArgs))
+        self._write('call %s %d\n' % (name, nArgs))
 
     def writeFunction(self, name, nLocals):
         """functionコマンドを書く．
@@ -69,14 +84,35 @@ class VMWriter:
             name (string): 関数名
             nLocals (int): ローカル変数の個数
         """
-        self.file.write('function %s %d\n' % (name, nLocals))
+        self._write('function %s %d\n' % (name, nLocals))
 
     def writeReturn(self):
         """returnコマンドを書く．
         """
-        self.file.write('return\n')
+        self._write('return\n')
+
+    def getText(self):
+        """メモリ上に書いたVMコードを返す．
+
+        Returns:
+            string: VMコード
+        """
+        self._flush()
+        return self.file.getvalue()
 
     def close(self):
-        """出力ファイルを閉じる．
+        """出力ファイルを閉じる．メモリ上の場合はgetTextで読めるよう閉じない．
         """
-        self.file.close()
+        self._flush()
+        if not self.in_memory:
+            self.file.close()
+
+    def _write(self, command):
+        self._buffer.append(command)
+        if len(self._buffer) >= _BUFFER_COMMANDS:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self.file.write(''.join(self._buffer))
+            self._buffer = []
@@ -0,0 +1,97 @@
+import os
+
+
+class XMLWriter:
+
+    def __init__(self, output_file):
+        """構文木を書き出すXMLファイルを開く．
+
+        Args:
+            output_file (string): 出力ファイル名
+        """
+        self.output_file = output_file
+        self.file = open(output_file, 'w')
+        self.indent_level = 0
+
+    def writeElement(self, tag_name, value):
+        """要素を書き出す．
+
+        Args:
+            tag_name (TagName): タグ名
+            value (string): 値
+        """
+        indent = '  ' * self.indent_level
+        self.file.write('%s<%s> %s </%s>\n' %
+                        (indent, tag_name.value, value, tag_name.value))
+
+    def writeElementStart(self, tag_name):
+        """開始要素を書き出す．
+
+        Args:
+            tag_name (TagName): タグ名
+        """
+        indent = '  ' * self.indent_level
+        self.file.write('%s<%s>\n' % (indent, tag_name.value))
+        self.indent_level += 1
+
+    def writeElementEnd(self, tag_name):
+        """終了要素を書き出す．
+
+        Args:
+            tag_name (TagName): タグ名
+        """
+        self.indent_level -= 1
+        indent = '  ' * self.indent_level
+        self.file.write('%s</%s>\n' % (indent, tag_name.value))
+
+    def writeIdentifier(self, name, declaration, symbol_table):
+        """識別子を，シンボルテーブル上の情報とともに書き出す．
+
+        Args:
+            name (string): 識別子
+            declaration (boolean): 宣言か
+            symbol_table (SymbolTable): 現在のシンボルテーブル
+        """
+        type = symbol_table.typeOf(name)
+        kind = symbol_table.kindOf(name)
+        index = symbol_table.indexOf(name)
+        info = 'declaration: %s, type: %s, kind: %s, index: %s' % (
+            declaration, type, kind, index)
+
+        indent = '  ' * self.indent_level
+        self.file.write('%s<identifier> %s </identifier> %s\n' %
+                        (indent, name, info))
+
+    def close(self):
+        """出力ファイルを閉じる．
+        """
+        self.file.close()
+
+    def discard(self):
+        """出力ファイルを閉じて削除する．コンパイルに失敗した場合に使う．
+        """
+        self.file.close()
+        os.remove(self.output_file)
+
+
+class NullXMLWriter:
+    """何も書き出さないXMLWriter．構文木が不要な場合に使う．
+    """
+
+    def writeElement(self, tag_name, value):
+        pass
+
+    def writeElementStart(self, tag_name):
+        pass
+
+    def writeElementEnd(self, tag_name):
+        pass
+
+    def writeIdentifier(self, name, declaration, symbol_table):
+        pass
+
+    def close(self):
+        pass
+
+    def discard(self):
+        pass